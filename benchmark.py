@@ -0,0 +1,168 @@
+import argparse
+import json
+import os
+import platform
+import shutil
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+# The recording scenario needs a display surface, not a window
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+
+import numpy as np
+from model import EvacuationModel
+from profiling import profiler
+
+# name: (boids, measured steps, options)
+SCENARIOS = {
+    "boids-500": (500, 300, {}),
+    "boids-2k": (2_000, 100, {}),
+    "boids-10k": (10_000, 30, {}),
+    "boids-50k": (50_000, 5, {}),
+    "boids-50k-grid": (50_000, 10, {"flocking": "grid"}),
+    # Around FLOCKING_GRID_MIN_BOIDS: below it, grid flocking runs the exact path
+    "boids-500-grid": (500, 300, {"flocking": "grid"}),
+    "smoke-saturated": (2_000, 100, {"smoke": 0.8}),
+    "recording": (500, 120, {"record": True}),
+    "trajectory": (2_000, 100, {"trajectory": True}),
+    "crowd-100k": (100_000, 10, {"crowd": True}),
+}
+# Unmeasured steps first (probe cache, sprite atlas, encoder start-up)
+WARMUP_STEPS = 2
+
+
+def saturate_smoke(model, level):
+    """Fill every open cell of the building with smoke"""
+    fire = model.fire_manager
+    fire.smoke_concentration[fire.interior & ~fire.wall_grid] = level
+
+
+def run_scenario(num_boids, steps, options, seed):
+    """Run one seeded scenario and return its steps/s and mean per-step phases"""
+    record = options.get("record", False)
+    output = None
+    if record:
+        from simulation import SimulationRecorder
+        model = SimulationRecorder(num_boids=num_boids, seed=seed, crowd_field=options.get("crowd", False),
+                                   flocking=options.get("flocking", "exact"))
+        output = os.path.join(tempfile.mkdtemp(), "benchmark.mp4")
+        model.start_recording(output)
+    else:
+        model = EvacuationModel(num_boids=num_boids, seed=seed, crowd_field=options.get("crowd", False),
+                                flocking=options.get("flocking", "exact"))
+    if "smoke" in options:
+        saturate_smoke(model, options["smoke"])
+    trajectory = None
+    if options.get("trajectory"):
+        trajectory = tempfile.mkdtemp()
+        model.start_trajectory(trajectory)
+
+    def advance():
+        model.update()
+        if record:
+            model.draw()
+        profiler.end_frame()
+
+    try:
+        for _ in range(WARMUP_STEPS):
+            advance()
+        profiler.reset()
+
+        start = time.perf_counter()
+        done = 0
+        while done < steps and not model.is_finished():
+            advance()
+            done += 1
+        elapsed = time.perf_counter() - start
+    finally:
+        if record:
+            model.stop_recording()
+            os.remove(output)
+            os.rmdir(os.path.dirname(output))
+        if trajectory:
+            model.stop_trajectory()
+            shutil.rmtree(trajectory)
+
+    frames = profiler.frames
+    columns = sorted({column for frame in frames for column in frame} - {"frame", "frame_ms"})
+    means = {column: float(np.mean([frame.get(column, 0) for frame in frames])) for column in columns}
+    return {
+        "boids": num_boids,
+        "steps": done,
+        "seconds": elapsed,
+        "steps_per_second": done / elapsed if elapsed > 0 else 0.0,
+        "phases_ms": {column[:-3]: value for column, value in means.items() if column.endswith("_ms")},
+        "counters": {column: value for column, value in means.items() if not column.endswith("_ms")},
+    }
+
+
+def compare(results, baseline, threshold):
+    """Print the change in steps/s against the baseline; returns the regressed scenarios"""
+    regressions = []
+    print(f"\n{'Scenario':<18}{'Baseline':>12}{'Current':>12}{'Change':>10}")
+    for name, result in results["scenarios"].items():
+        reference = baseline["scenarios"].get(name)
+        if reference is None or reference["steps_per_second"] <= 0:
+            print(f"{name:<18}{'-':>12}{result['steps_per_second']:>12.2f}{'new':>10}")
+            continue
+        change = result["steps_per_second"] / reference["steps_per_second"] - 1
+        flag = ""
+        if change < -threshold:
+            regressions.append(name)
+            flag = "  REGRESSION"
+        print(f"{name:<18}{reference['steps_per_second']:>12.2f}{result['steps_per_second']:>12.2f}"
+              f"{change:>+10.1%}{flag}")
+    return regressions
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Seeded headless benchmarks of the evacuation engine')
+    parser.add_argument('--scenarios', nargs='+', choices=list(SCENARIOS), default=list(SCENARIOS),
+                      help='Scenarios to run (default: all)')
+    parser.add_argument('--steps-scale', type=float, default=1.0,
+                      help='Multiply the measured steps of every scenario (default: 1)')
+    parser.add_argument('--seed', type=int, default=1234,
+                      help='Seed shared by every scenario (default: 1234)')
+    parser.add_argument('--output', '-o', type=str, default='benchmark_results.json',
+                      help='Where to save the results (default: benchmark_results.json)')
+    parser.add_argument('--baseline', '-b', type=str,
+                      help='Results file to compare against; exits with status 1 on regression')
+    parser.add_argument('--threshold', type=float, default=0.10,
+                      help='Allowed steps/s slowdown against the baseline (default: 0.10)')
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    profiler.enable()
+
+    results = {
+        "date": datetime.now().isoformat(timespec="seconds"),
+        "seed": args.seed,
+        "python": sys.version.split()[0],
+        "numpy": np.__version__,
+        "platform": platform.platform(),
+        "scenarios": {},
+    }
+    for name in args.scenarios:
+        num_boids, steps, options = SCENARIOS[name]
+        steps = max(1, int(steps * args.steps_scale))
+        print(f"Running {name} ({num_boids} boids, {steps} steps)...")
+        result = run_scenario(num_boids, steps, options, args.seed)
+        results["scenarios"][name] = result
+        phases = ", ".join(f"{phase} {ms:.1f}" for phase, ms in result["phases_ms"].items())
+        print(f"  {result['steps_per_second']:.2f} steps/s  ({phases} ms/step)")
+
+    with open(args.output, "w") as f:
+        json.dump(results, f, indent=2)
+    print(f"Results saved as {args.output}")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.threshold)
+        if regressions:
+            print(f"\nSlower than baseline by more than {args.threshold:.0%}: {', '.join(regressions)}")
+            sys.exit(1)
@@ -1,10 +1,17 @@
+import itertools
 import pygame
 import random
 import math
+import numpy as np
 from config import *
+from profiling import profiler
 
 class Boid:
+    # Identifiants stables, utilisés comme clés dans les files de sortie
+    ids = itertools.count()
+
     def __init__(self, x, y, game_map, room_id=1):
+        self.boid_id = next(Boid.ids)
         self.position = pygame.Vector2(x, y)
         angle = random.uniform(0, 2 * math.pi)
         self.velocity = pygame.Vector2(math.cos(angle), math.sin(angle)) * MAX_SPEED
@@ -84,69 +91,57 @@ class Boid:
                     separation += diff.normalize() / distance
         return separation
 
-    def get_smoke_avoidance_force(self, fire_manager):
+    def get_smoke_avoidance_force(self, fire_manager, current_smoke=None):
         """Calcule la force d'évitement de la fumée en tenant compte des murs"""
         avoidance = pygame.Vector2(0, 0)
-        check_radius = SMOKE_AVOIDANCE_RADIUS
-        check_points = 8  # Nombre de points à vérifier autour du boid
         
         # Vérifier si le boid est déjà dans la fumée
-        current_smoke = fire_manager.get_smoke_at_position(self.position.x, self.position.y)
+        if current_smoke is None:
+            current_smoke = fire_manager.get_smoke_at_position(self.position.x, self.position.y)
         if current_smoke > 0.1:
             return avoidance  # Pas de force d'évitement si déjà dans la fumée
         
-        for i in range(check_points):
-            angle = 2 * math.pi * i / check_points
-            check_pos = self.position + pygame.Vector2(
-                math.cos(angle) * check_radius,
-                math.sin(angle) * check_radius
-            )
-            
-            # Vérifier si un mur bloque la vue entre le boid et le point de vérification
-            if self.map.is_line_of_sight_clear(self.position, check_pos):
-                # Obtenir la concentration de fumée au point de vérification seulement si visible
-                smoke = fire_manager.get_smoke_at_position(check_pos.x, check_pos.y)
-                
-                if smoke > 0.1:  # Seuil de détection de la fumée
-                    # Vecteur d'évitement pointant à l'opposé de la fumée
-                    avoid_vector = self.position - check_pos
-                    if avoid_vector.length() > 0:
-                        avoid_vector.normalize_ip()
-                        # Force proportionnelle à la concentration de fumée
-                        avoidance += avoid_vector * (smoke * SMOKE_AVOIDANCE_STRENGTH)
+        # Points de vérification sur le cercle SMOKE_AVOIDANCE_RADIUS, fumée lue en un seul appel
+        circle = self.map.PROBE_RADII.index(SMOKE_AVOIDANCE_RADIUS)
+        position = np.array([self.position.x, self.position.y])
+        check_points = position + self.map.probe_offsets[circle]
+        smoke_values = fire_manager.sample_smoke(check_points[:, 0], check_points[:, 1])
+        # Vérifier si un mur bloque la vue (cache de visibilité de la carte)
+        visible = self.map.probe_visibility(position)[0, circle]
+        
+        for (x, y), smoke, clear in zip(check_points, smoke_values, visible):
+            if clear and smoke > 0.1:  # Seuil de détection de la fumée
+                # Vecteur d'évitement pointant à l'opposé de la fumée
+                avoid_vector = self.position - pygame.Vector2(x, y)
+                if avoid_vector.length() > 0:
+                    avoid_vector.normalize_ip()
+                    # Force proportionnelle à la concentration de fumée
+                    avoidance += avoid_vector * (smoke * SMOKE_AVOIDANCE_STRENGTH)
         
         return avoidance
     
-    def update_boid_PR(self, fire_manager):
+    def update_boid_PR(self, fire_manager, current_smoke=None):
         if self.boid_PR == 1:  #Once at 1, don't make the check again
             return
     
-        range_test = [SMOKE_AVOIDANCE_RADIUS * 1.5, SMOKE_AVOIDANCE_RADIUS, SMOKE_AVOIDANCE_RADIUS * 0.5]
-        check_points = 8 
-        slf_smoke = fire_manager.get_smoke_at_position(self.position.x, self.position.y)
+        if current_smoke is None:
+            current_smoke = fire_manager.get_smoke_at_position(self.position.x, self.position.y)
 
-        if slf_smoke > 0.1 : # try on the boids position
+        if current_smoke > 0.1 : # try on the boids position
             self.boid_PR = 1
             return
 
-        for range_test in range_test : 
-            for i in range(check_points):
-                angle = 2 * math.pi * i / check_points  
-                check_pos = self.position + pygame.Vector2(
-                    math.cos(angle) * range_test,
-                    math.sin(angle) * range_test
-                )
-        
-            # check for wall
-                if self.map.is_line_of_sight_clear(self.position, check_pos):
-                    smoke = fire_manager.get_smoke_at_position(check_pos.x, check_pos.y)
-            
-                    if smoke > 0.1:  
-                     self.boid_PR = 1 
-                     return  
+        # 3 cercles de 8 points : fumée en un seul appel, murs via le cache de visibilité
+        position = np.array([self.position.x, self.position.y])
+        check_points = position + self.map.probe_offsets
+        smoke_values = fire_manager.sample_smoke(check_points[..., 0], check_points[..., 1])
+        visible = self.map.probe_visibility(position)[0]
+
+        if ((smoke_values > 0.1) & visible).any():
+            self.boid_PR = 1
 
     def find_nearest_exit(self):
-        """Trouve la sortie la plus appropriée basée sur l'orientation du boid"""
+        """Direction vers la sortie la plus appropriée basée sur l'orientation du boid"""
         if self.current_room is None:
             return None
             
@@ -159,13 +154,20 @@ class Boid:
             boid_direction = self.velocity.normalize()
         else:
             return None
+
+        # Plus courts chemins autour des obstacles, lus dans la cellule du boid
+        if self.map.flow_field is not None:
+            path_length, path_direction = self.map.flow_field.lookup(np.array([[self.position.x, self.position.y]]))
         
-        for exit_info in current_room["exits"]:
+        for k, exit_info in enumerate(current_room["exits"]):
             exit_pos = pygame.Vector2(exit_info["position"])
             
             # Vecteur vers la sortie
             to_exit = exit_pos - self.position
             distance = to_exit.length()
+            if self.map.flow_field is not None and np.isfinite(path_length[0, k]):
+                to_exit = pygame.Vector2(*path_direction[0, k])
+                distance = float(path_length[0, k])
             if distance > 0:
                 to_exit = to_exit.normalize()
                 
@@ -178,7 +180,7 @@ class Boid:
                 
                 if score > best_score:
                     best_score = score
-                    best_exit = exit_pos
+                    best_exit = to_exit
                     
         return best_exit
 
@@ -213,17 +215,18 @@ class Boid:
                             return True
         return False
         
-    def update(self, boids, exit_manager, fire_manager=None):
+    def update(self, boids, exit_manager, fire_manager=None, neighbor_index=None):
         """Mise à jour avec évitement de la fumée modifié"""
         if not self.is_alive or self.current_room is None or self.queued_at_exit:
             return
             
         # Mise à jour de la santé et des percived risk
+        smoke = 0
         if fire_manager:
             smoke = fire_manager.get_smoke_at_position(self.position.x, self.position.y)
             temp = fire_manager.get_temperature_at_position(self.position.x, self.position.y)
             self.update_health(smoke, temp)
-            self.update_boid_PR(fire_manager)
+            self.update_boid_PR(fire_manager, smoke)
 
         is_stopped = False
         changed_direction = False
@@ -242,8 +245,10 @@ class Boid:
                 changed_direction = True
                 
         if not is_stopped and not changed_direction:  
-            # Forces de base
-            visible_boids = [b for b in self.get_visible_boids(boids) 
+            # Forces de base (candidats limités aux cellules voisines si un index est fourni)
+            candidates = neighbor_index.nearby(self) if neighbor_index is not None else boids
+            profiler.count("neighbors_examined", len(candidates))
+            visible_boids = [b for b in self.get_visible_boids(candidates) 
                             if b.current_room == self.current_room]
             
             alignment = self.align(visible_boids)
@@ -254,22 +259,18 @@ class Boid:
             # Force d'évitement de la fumée
             smoke_avoidance = pygame.Vector2(0, 0)
             if fire_manager:
-                smoke_avoidance = self.get_smoke_avoidance_force(fire_manager)
+                smoke_avoidance = self.get_smoke_avoidance_force(fire_manager, smoke)
             
             exit_attraction = pygame.Vector2(0, 0)#def of the attraction 
 
             # Force vers la sortie (plus forte en présence de fumée)
             if self.boid_PR == 1:
-                nearest_exit = self.find_nearest_exit()
+                exit_direction = self.find_nearest_exit()
                 exit_attraction = pygame.Vector2(0, 0)
-                if nearest_exit:
-                    to_exit = nearest_exit - self.position
-                    if to_exit.length() > 0:
-                        exit_attraction = to_exit.normalize() * EXIT_STRENGTH
-                        # Augmenter l'attraction vers la sortie si il y a de la fumée
-                        if fire_manager:
-                            smoke = fire_manager.get_smoke_at_position(self.position.x, self.position.y)
-                            exit_attraction *= (1 + smoke * 2)
+                if exit_direction:
+                    exit_attraction = exit_direction * EXIT_STRENGTH
+                    # Augmenter l'attraction vers la sortie si il y a de la fumée
+                    exit_attraction *= (1 + smoke * 2)
             
             # Appliquer toutes les forces
             self.velocity += (
@@ -287,10 +288,8 @@ class Boid:
         if self.boid_PR == 0:
             current_speed *= 0.5
 
-        if fire_manager:
-            # Ralentissement dans la fumée
-            smoke = fire_manager.get_smoke_at_position(self.position.x, self.position.y)
-            current_speed *= (1 - smoke * SMOKE_SLOWDOWN_FACTOR) 
+        # Ralentissement dans la fumée (la position n'a pas changé depuis l'échantillonnage)
+        current_speed *= (1 - smoke * SMOKE_SLOWDOWN_FACTOR) 
             
         if not is_stopped and self.velocity.length() < 0.1:
             self.velocity = pygame.Vector2(self.last_direction) * (current_speed * 0.5)
@@ -0,0 +1,106 @@
+import math
+import numpy as np
+import pygame
+from config import *
+
+# Couleur transparente des sprites (jamais utilisée par les boids)
+COLORKEY = (255, 0, 255)
+
+
+class BoidSpriteAtlas:
+    """Atlas de sprites pré-rendus pour dessiner beaucoup de boids d'un coup.
+
+    Le corps d'un boid (indicateur boid_PR + triangle orienté) est rendu une fois
+    par orientation, par palier de santé et par état boid_PR ; la barre de vie
+    une fois par palier de santé. draw() calcule les indices depuis les tableaux
+    de positions et envoie tous les boids en un seul appel à Surface.blits.
+    """
+
+    HEADINGS = 32
+    HEALTH_STEPS = 20  # paliers de 5 points de vie
+    # Palier de couleur supplémentaire pour les boids en file à une sortie
+    QUEUED_COLOR = HEALTH_STEPS + 1
+
+    # Taille du sprite de corps et position du boid dans ce sprite
+    BODY_SIZE = (22, BOID_RADIUS + 20)
+    BODY_CENTER = (11, BOID_RADIUS + 13)
+    BAR_SIZE = (20, 3)
+
+    def __init__(self):
+        self.atlas = None
+        self.body_areas = None
+        self.bar_areas = None
+
+    def build(self):
+        """Rend tous les sprites dans une seule surface"""
+        body_w, body_h = self.BODY_SIZE
+        bar_w, bar_h = self.BAR_SIZE
+        colors = self.QUEUED_COLOR + 1
+        body_rows = 2 * colors
+        atlas = pygame.Surface((max(self.HEADINGS * body_w, (self.HEALTH_STEPS + 1) * bar_w),
+                                body_rows * body_h + bar_h))
+        atlas.fill(COLORKEY)
+
+        cx, cy = self.BODY_CENTER
+        self.body_areas = []
+        for boid_PR in (0, 1):
+            indicator_color = (0, 255, 0) if boid_PR == 0 else (255, 0, 0)
+            for color_index in range(colors):
+                if color_index == self.QUEUED_COLOR:
+                    color = (200, 100, 100)
+                else:
+                    health_ratio = color_index / self.HEALTH_STEPS
+                    color = (int(255 * (1 - health_ratio)), int(255 * health_ratio), 50)
+                top = (boid_PR * colors + color_index) * body_h
+                for heading in range(self.HEADINGS):
+                    left = heading * body_w
+                    angle = heading * 2 * math.pi / self.HEADINGS
+                    pygame.draw.circle(atlas, indicator_color, (left + cx, top + cy - BOID_RADIUS - 8), 4)
+                    points = [(left + cx + BOID_RADIUS * math.cos(a), top + cy + BOID_RADIUS * math.sin(a))
+                              for a in (angle, angle + 2.6, angle - 2.6)]
+                    pygame.draw.polygon(atlas, color, points)
+                    self.body_areas.append(pygame.Rect(left, top, body_w, body_h))
+
+        # Barres de vie : fond rouge et part verte arrondie au palier
+        top = body_rows * body_h
+        self.bar_areas = []
+        for step in range(self.HEALTH_STEPS + 1):
+            left = step * bar_w
+            pygame.draw.rect(atlas, (255, 0, 0), (left, top, bar_w, bar_h))
+            pygame.draw.rect(atlas, (0, 255, 0), (left, top, bar_w * step / self.HEALTH_STEPS, bar_h))
+            self.bar_areas.append(pygame.Rect(left, top, bar_w, bar_h))
+
+        atlas.set_colorkey(COLORKEY)
+        if pygame.display.get_surface() is not None:
+            atlas = atlas.convert()
+            atlas.set_colorkey(COLORKEY)
+        self.atlas = atlas
+
+    def draw(self, screen, positions, directions, health, boid_PR, queued):
+        """Dessine les boids décrits par les tableaux (un boid par ligne)"""
+        if len(positions) == 0:
+            return
+        if self.atlas is None:
+            self.build()
+
+        angles = np.arctan2(directions[:, 1], directions[:, 0])
+        headings = np.rint(angles * (self.HEADINGS / (2 * math.pi))).astype(np.int64) % self.HEADINGS
+        health_steps = np.clip(np.rint(health * (self.HEALTH_STEPS / 100)), 0, self.HEALTH_STEPS).astype(np.int64)
+        colors = np.where(queued, self.QUEUED_COLOR, health_steps)
+        body_index = ((boid_PR.astype(np.int64) * (self.QUEUED_COLOR + 1) + colors) * self.HEADINGS
+                      + headings)
+
+        xs = np.floor(positions[:, 0]).astype(np.int64)
+        ys = np.floor(positions[:, 1]).astype(np.int64)
+        body_x = (xs - self.BODY_CENTER[0]).tolist()
+        body_y = (ys - self.BODY_CENTER[1]).tolist()
+        bar_x = (xs - self.BAR_SIZE[0] // 2).tolist()
+        bar_y = (ys - BOID_RADIUS - 5).tolist()
+
+        atlas, body_areas, bar_areas = self.atlas, self.body_areas, self.bar_areas
+        sequence = []
+        for bx, by, body, hx, hy, bar in zip(body_x, body_y, body_index.tolist(),
+                                              bar_x, bar_y, health_steps.tolist()):
+            sequence.append((atlas, (bx, by), body_areas[body]))
+            sequence.append((atlas, (hx, hy), bar_areas[bar]))
+        screen.blits(sequence, doreturn=False)
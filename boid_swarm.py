@@ -0,0 +1,463 @@
+import math
+import numpy as np
+from config import *
+from spatial_hash import SpatialGrid
+from boid_sprites import BoidSpriteAtlas
+from profiling import profiler
+
+# Valeur de current_room pour un boid sorti du bâtiment (équivalent de None pour Boid)
+NO_ROOM = 0
+
+
+class BoidSwarm:
+    """Moteur des boids en structure de tableaux.
+
+    Reprend les règles de Boid.update, mais pour tous les boids à la fois :
+    positions, vitesses, santé, boid_PR, current_room et queued_at_exit sont
+    stockés dans des tableaux NumPy contigus. Chaque boid garde un identifiant
+    stable (``ids``) qui sert de clé dans les files de sortie.
+    """
+
+    def __init__(self, game_map, rng=None, flocking=FLOCKING_MODE):
+        self.map = game_map
+        self.rng = rng if rng is not None else np.random.default_rng()
+        if flocking not in ("exact", "grid"):
+            raise ValueError(f"Unknown flocking mode: {flocking}")
+        self.flocking = flocking
+
+        self.ids = np.zeros(0, dtype=np.int64)
+        self.positions = np.zeros((0, 2))
+        self.velocities = np.zeros((0, 2))
+        self.last_direction = np.zeros((0, 2))
+        self.health = np.zeros(0)
+        self.is_alive = np.zeros(0, dtype=bool)
+        self.boid_PR = np.zeros(0, dtype=np.int8)
+        self.current_room = np.zeros(0, dtype=np.int32)
+        self.queued_at_exit = np.zeros(0, dtype=np.int32)
+        self.base_speed = np.zeros(0)
+        self.next_id = 0
+
+        self.neighbor_grid = SpatialGrid(VISION_RADIUS)
+        # Mode "grid" : seule la séparation passe par des paires, à courte portée
+        self.separation_grid = SpatialGrid(BOID_RADIUS * 4)
+        self.sprites = BoidSpriteAtlas()
+        self.init_exit_tables()
+        self.init_flocking_tables()
+
+    def __len__(self):
+        return len(self.ids)
+
+    def init_exit_tables(self):
+        """Range les sorties de chaque salle dans des tableaux indexés par room_id"""
+        max_room = max(ROOMS.keys())
+        max_exits = max(len(room["exits"]) for room in ROOMS.values())
+
+        self.exit_positions = np.zeros((max_room + 1, max_exits, 2))
+        self.exit_directions = np.zeros((max_room + 1, max_exits, 2))
+        self.exit_widths = np.zeros((max_room + 1, max_exits))
+        self.exit_ids = np.zeros((max_room + 1, max_exits), dtype=np.int32)
+        self.exit_valid = np.zeros((max_room + 1, max_exits), dtype=bool)
+
+        for room_id, room in ROOMS.items():
+            for k, exit_info in enumerate(room["exits"]):
+                self.exit_positions[room_id, k] = exit_info["position"]
+                self.exit_directions[room_id, k] = exit_info["direction"]
+                self.exit_widths[room_id, k] = exit_info["width"]
+                self.exit_ids[room_id, k] = exit_info["id"]
+                self.exit_valid[room_id, k] = True
+
+    def init_flocking_tables(self):
+        """Cellules de FLOCKING_GRID_SIZE px couvrant chaque salle, et tables de sommes réutilisées"""
+        size = FLOCKING_GRID_SIZE
+        num_rooms = self.exit_positions.shape[0]
+        self.room_origin = np.zeros((num_rooms, 2), dtype=np.int64)
+        extents = []
+        for room_id, room in ROOMS.items():
+            x, y, w, h = room["bounds"]
+            self.room_origin[room_id] = (x // size, y // size)
+            extents.append(((x + w) // size - x // size + 1, (y + h) // size - y // size + 1))
+        self.room_cells = tuple(np.max(extents, axis=0))  # (largeur, hauteur)
+        # Tables de sommes cumulées (masse, vitesses, positions) des salles occupées ;
+        # la première ligne et la première colonne restent nulles
+        width, height = self.room_cells
+        self.flocking_table = np.zeros((5, num_rooms, height + 1, width + 1))
+
+    def add_boids(self, xs, ys, room_ids):
+        """Ajoute des boids avec une direction initiale aléatoire"""
+        xs = np.asarray(xs, dtype=float)
+        ys = np.asarray(ys, dtype=float)
+        n = len(xs)
+
+        angles = self.rng.uniform(0, 2 * math.pi, n)
+        directions = np.column_stack((np.cos(angles), np.sin(angles)))
+
+        self.ids = np.concatenate((self.ids, np.arange(self.next_id, self.next_id + n)))
+        self.next_id += n
+        self.positions = np.concatenate((self.positions, np.column_stack((xs, ys))))
+        self.velocities = np.concatenate((self.velocities, directions * MAX_SPEED))
+        self.last_direction = np.concatenate((self.last_direction, directions))
+        self.health = np.concatenate((self.health, np.full(n, 100.0)))
+        self.is_alive = np.concatenate((self.is_alive, np.ones(n, dtype=bool)))
+        self.boid_PR = np.concatenate((self.boid_PR, np.zeros(n, dtype=np.int8)))
+        self.current_room = np.concatenate(
+            (self.current_room, np.broadcast_to(np.asarray(room_ids, dtype=np.int32), (n,))))
+        self.queued_at_exit = np.concatenate((self.queued_at_exit, np.zeros(n, dtype=np.int32)))
+        self.base_speed = np.concatenate((self.base_speed, np.full(n, float(MAX_SPEED))))
+
+    def spawn(self, num_boids):
+        """Répartit num_boids dans les zones d'apparition, comme SimulationRecorder.create_boids"""
+        boids_per_room = num_boids // len(ROOMS)
+        remaining_boids = num_boids % len(ROOMS)
+
+        for room_id, room in ROOMS.items():
+            num_room_boids = boids_per_room
+            if remaining_boids > 0:
+                num_room_boids += 1
+                remaining_boids -= 1
+
+            spawn = room["spawn_area"]
+            xs = self.rng.integers(spawn[0], spawn[0] + spawn[2] + 1, num_room_boids)
+            ys = self.rng.integers(spawn[1], spawn[1] + spawn[3] + 1, num_room_boids)
+            self.add_boids(xs, ys, room_id)
+
+    def index_of(self, boid_id):
+        """Retrouve la ligne d'un boid à partir de son identifiant stable"""
+        # Les ids sont attribués dans l'ordre et la compaction conserve cet ordre
+        row = int(np.searchsorted(self.ids, boid_id))
+        if row < len(self.ids) and self.ids[row] == boid_id:
+            return row
+        return None
+
+    # ------------------------------------------------------------------
+    # Perception
+    # ------------------------------------------------------------------
+
+    def update_boid_PR(self, rows, positions, own_smoke, fire_manager):
+        """Passe boid_PR à 1 si de la fumée est visible (même règle que Boid.update_boid_PR)"""
+        calm = self.boid_PR[rows] == 0
+        alarmed = calm & (own_smoke > 0.1)
+
+        pending = np.flatnonzero(calm & ~alarmed)
+        if pending.size:
+            # 3 cercles de 8 points, visibilité lue dans le cache de la carte
+            ends = positions[pending][:, None, None, :] + self.map.probe_offsets[None]
+            smoky = fire_manager.sample_smoke(ends[..., 0], ends[..., 1]) > 0.1
+            visible = self.map.probe_visibility(positions[pending])
+            alarmed[pending[(smoky & visible).any(axis=(1, 2))]] = True
+
+        self.boid_PR[rows[alarmed]] = 1
+
+    def get_smoke_avoidance_forces(self, positions, own_smoke, fire_manager):
+        """Force d'évitement de la fumée, en tenant compte des murs"""
+        avoidance = np.zeros_like(positions)
+        outside = np.flatnonzero(own_smoke <= 0.1)
+        if outside.size == 0:
+            return avoidance
+
+        circle = self.map.PROBE_RADII.index(SMOKE_AVOIDANCE_RADIUS)
+        offsets = self.map.probe_offsets[circle]
+        ends = positions[outside][:, None, :] + offsets[None, :, :]
+        smoke = fire_manager.sample_smoke(ends[..., 0], ends[..., 1])
+        visible = self.map.probe_visibility(positions[outside])[:, circle]
+
+        # Vecteur d'évitement opposé à chaque point enfumé visible, proportionnel à la fumée
+        weight = np.where((smoke > 0.1) & visible, smoke * SMOKE_AVOIDANCE_STRENGTH, 0.0)
+        avoidance[outside] = -(weight[..., None] * offsets[None, :, :]).sum(axis=1) / SMOKE_AVOIDANCE_RADIUS
+        return avoidance
+
+    def neighbor_sums(self, rows, grid=None, radius=VISION_RADIUS):
+        """Somme des vitesses, positions et répulsions des boids visibles de la même salle"""
+        grid = grid if grid is not None else self.neighbor_grid
+        n = len(rows)
+        count = np.zeros(n)
+        velocity_sum = np.zeros((n, 2))
+        position_sum = np.zeros((n, 2))
+        separation = np.zeros((n, 2))
+
+        # Index spatial reconstruit une fois par pas, par cellule et par salle
+        candidates = np.flatnonzero(self.is_alive & (self.current_room != NO_ROOM))
+        if candidates.size == 0 or n == 0:
+            return count, velocity_sum, position_sum, separation
+        grid.rebuild(self.positions[candidates], self.current_room[candidates])
+
+        query_pos = self.positions[rows]
+        for query, point in grid.candidate_pairs(query_pos, self.current_room[rows]):
+            profiler.count("neighbors_examined", len(query))
+            other = candidates[point]
+            diff = query_pos[query] - self.positions[other]
+            dist = np.hypot(diff[:, 0], diff[:, 1])
+            visible = (dist < radius) & (other != rows[query])
+            query, other, diff, dist = query[visible], other[visible], diff[visible], dist[visible]
+
+            count += np.bincount(query, minlength=n)
+            for axis in (0, 1):
+                velocity_sum[:, axis] += np.bincount(query, self.velocities[other, axis], minlength=n)
+                position_sum[:, axis] += np.bincount(query, self.positions[other, axis], minlength=n)
+
+            close = (dist > 0) & (dist < BOID_RADIUS * 4)
+            weight = 1.0 / dist[close] ** 2
+            for axis in (0, 1):
+                separation[:, axis] += np.bincount(query[close], diff[close, axis] * weight, minlength=n)
+
+        return count, velocity_sum, position_sum, separation
+
+    def grid_flocking_sums(self, rows):
+        """Nombre, somme des vitesses et des positions des voisins, approchés sur une grille.
+
+        Les boids sont répartis dans des cellules de FLOCKING_GRID_SIZE px couvrant
+        leur salle (bincount), puis une table de sommes cumulées donne en quatre
+        lectures le total d'un carré autour de chaque boid : O(N + cellules) au
+        lieu de O(N·voisins). Le carré a la même aire que le disque de
+        VISION_RADIUS. Seules les salles occupées ont une table, dans un tampon
+        réutilisé d'un pas à l'autre.
+        """
+        n = len(rows)
+        candidates = np.flatnonzero(self.is_alive & (self.current_room != NO_ROOM))
+        if candidates.size == 0 or n == 0:
+            return np.zeros(n), np.zeros((n, 2)), np.zeros((n, 2))
+
+        size = FLOCKING_GRID_SIZE
+        width, height = self.room_cells
+        half = int(round(VISION_RADIUS * math.sqrt(math.pi) / 2 / size))
+
+        # Salles occupées, numérotées de 0 à len(occupied) - 1
+        occupied, slots = np.unique(self.current_room[candidates], return_inverse=True)
+        slot_of_room = np.zeros(len(self.room_origin), dtype=np.int64)
+        slot_of_room[occupied] = np.arange(len(occupied))
+
+        def cells(positions, room_ids):
+            origin = self.room_origin[room_ids]
+            cell_x = np.clip(np.floor(positions[:, 0] / size).astype(np.int64) - origin[:, 0], 0, width - 1)
+            cell_y = np.clip(np.floor(positions[:, 1] / size).astype(np.int64) - origin[:, 1], 0, height - 1)
+            return cell_x, cell_y
+
+        # Masse, quantité de mouvement et somme des positions par (salle, cellule)
+        positions = self.positions[candidates]
+        velocities = self.velocities[candidates]
+        cell_x, cell_y = cells(positions, self.current_room[candidates])
+        keys = (slots.astype(np.int64) * height + cell_y) * width + cell_x
+        fields = [None, velocities[:, 0], velocities[:, 1], positions[:, 0], positions[:, 1]]
+        table = self.flocking_table[:, :len(occupied)]
+        for k, weights in enumerate(fields):
+            binned = np.bincount(keys, weights, minlength=len(occupied) * height * width).reshape(-1, height, width)
+            np.cumsum(binned, axis=1, out=binned)
+            np.cumsum(binned, axis=2, out=table[k, :, 1:, 1:])
+
+        rooms = self.current_room[rows]
+        cell_x, cell_y = cells(self.positions[rows], rooms)
+        rooms = slot_of_room[rooms]
+        x0, x1 = np.clip(cell_x - half, 0, width), np.clip(cell_x + half + 1, 0, width)
+        y0, y1 = np.clip(cell_y - half, 0, height), np.clip(cell_y + half + 1, 0, height)
+        sums = (table[:, rooms, y1, x1] - table[:, rooms, y0, x1]
+                - table[:, rooms, y1, x0] + table[:, rooms, y0, x0])
+
+        # Le boid lui-même est compté dans sa cellule : on le retire
+        count = np.maximum(np.round(sums[0]) - 1, 0)
+        velocity_sum = sums[1:3].T - self.velocities[rows]
+        position_sum = sums[3:5].T - self.positions[rows]
+        return count, velocity_sum, position_sum
+
+    def find_nearest_exits(self, rows, velocities):
+        """Direction vers la sortie la mieux orientée pour chaque boid (même score que Boid.find_nearest_exit)"""
+        rooms = self.current_room[rows]
+        positions = self.positions[rows]
+        speed = np.hypot(velocities[:, 0], velocities[:, 1])
+        direction = velocities / np.where(speed > 0, speed, 1.0)[:, None]
+
+        to_exit = self.exit_positions[rooms] - positions[:, None, :]
+        distance = np.hypot(to_exit[..., 0], to_exit[..., 1])
+        unit = to_exit / np.where(distance > 0, distance, 1.0)[..., None]
+        flow_field = self.map.flow_field
+        if flow_field is not None:
+            # Longueur et direction du plus court chemin, une lecture par boid ;
+            # ligne droite pour les cellules d'où la sortie n'est pas atteignable
+            path_length, path_direction = flow_field.lookup(positions)
+            reachable = np.isfinite(path_length)
+            distance = np.where(reachable, path_length, distance)
+            unit = np.where(reachable[..., None], path_direction, unit)
+        valid = self.exit_valid[rooms] & (distance > 0)
+
+        score = (unit * direction[:, None, :]).sum(axis=2) * 2.0 - distance / 1000.0
+        score = np.where(valid, score, -np.inf)
+        best = np.argmax(score, axis=1)
+
+        found = valid.any(axis=1) & (speed > 0)
+        return unit[np.arange(len(rows)), best], found
+
+    # ------------------------------------------------------------------
+    # Mise à jour
+    # ------------------------------------------------------------------
+
+    def update(self, exit_manager, fire_manager=None):
+        """Mise à jour de tous les boids actifs"""
+        rows = np.flatnonzero(self.is_alive & (self.current_room != NO_ROOM) & (self.queued_at_exit == 0))
+        if rows.size == 0:
+            return
+        n = len(rows)
+        profiler.count("boids_updated", n)
+        positions = self.positions[rows]
+        velocities = self.velocities[rows]
+
+        # Mise à jour de la santé et des percived risk
+        own_smoke = np.zeros(n)
+        if fire_manager:
+            with profiler.span("perception"):
+                own_smoke = fire_manager.sample_smoke(positions[:, 0], positions[:, 1])
+                temperature = fire_manager.sample_temperature(positions[:, 0], positions[:, 1])
+                health = self.health[rows] - (own_smoke * SMOKE_DAMAGE_RATE + temperature * HEAT_DAMAGE_RATE)
+                dead = health <= 0
+                self.health[rows] = np.where(dead, 0.0, health)
+                self.is_alive[rows[dead]] = False
+                self.update_boid_PR(rows, positions, own_smoke, fire_manager)
+
+        panicking = self.boid_PR[rows] == 1
+
+        # Comportement de panique : arrêt ou changement de direction aléatoire
+        stop_draw = self.rng.random(n)
+        turn_draw = self.rng.random(n)
+        is_stopped = panicking & (stop_draw < CHANCE_TO_STOP)
+        changed_direction = panicking & ~is_stopped & (turn_draw < CHANCE_TO_CHANGE_DIRECTION)
+
+        velocities[is_stopped] = 0
+        turned = np.flatnonzero(changed_direction)
+        if turned.size:
+            angles = self.rng.uniform(0, 2 * math.pi, turned.size)
+            speeds = self.rng.uniform(0.5, self.base_speed[rows[turned]])
+            velocities[turned] = np.column_stack((np.cos(angles), np.sin(angles))) * speeds[:, None]
+
+        steering = np.flatnonzero(~is_stopped & ~changed_direction & self.is_alive[rows])
+        if steering.size:
+            steer_rows = rows[steering]
+            steer_pos = positions[steering]
+            steer_vel = velocities[steering]
+
+            # Forces de base
+            with profiler.span("neighbors"):
+                if self.flocking == "grid" and len(steer_rows) >= FLOCKING_GRID_MIN_BOIDS:
+                    count, velocity_sum, position_sum = self.grid_flocking_sums(steer_rows)
+                    separation = self.neighbor_sums(steer_rows, self.separation_grid, BOID_RADIUS * 4)[3]
+                else:
+                    count, velocity_sum, position_sum, separation = self.neighbor_sums(steer_rows)
+                has_neighbors = (count > 0)[:, None]
+                safe_count = np.maximum(count, 1)[:, None]
+                alignment = np.where(has_neighbors, velocity_sum / safe_count - steer_vel, 0.0)
+                cohesion = np.where(has_neighbors, position_sum / safe_count - steer_pos, 0.0)
+            with profiler.span("walls"):
+                wall_avoidance = self.map.get_wall_avoidance_forces(steer_pos)
+
+            forces = (alignment * ALIGNMENT_STRENGTH +
+                      cohesion * COHESION_STRENGTH +
+                      separation * SEPARATION_STRENGTH +
+                      wall_avoidance * WALL_AVOIDANCE_STRENGTH)
+
+            if fire_manager:
+                with profiler.span("perception"):
+                    forces += self.get_smoke_avoidance_forces(steer_pos, own_smoke[steering], fire_manager)
+
+            # Force vers la sortie (plus forte en présence de fumée)
+            attracted = np.flatnonzero(panicking[steering])
+            if attracted.size:
+                headings, found = self.find_nearest_exits(steer_rows[attracted], steer_vel[attracted])
+                attraction = headings * EXIT_STRENGTH
+                attraction *= (1 + own_smoke[steering][attracted] * 2)[:, None]
+                forces[attracted] += np.where(found[:, None], attraction, 0.0)
+
+            velocities[steering] = steer_vel + forces
+
+        # Limiter la vitesse
+        current_speed = self.base_speed[rows].copy()
+        current_speed[self.boid_PR[rows] == 0] *= 0.5
+        if fire_manager:
+            # Ralentissement dans la fumée
+            current_speed *= (1 - own_smoke * SMOKE_SLOWDOWN_FACTOR)
+
+        speed = np.hypot(velocities[:, 0], velocities[:, 1])
+        too_slow = ~is_stopped & (speed < 0.1)
+        too_fast = ~too_slow & (speed > current_speed)
+        velocities[too_slow] = self.last_direction[rows[too_slow]] * (current_speed[too_slow] * 0.5)[:, None]
+        velocities[too_fast] *= (current_speed[too_fast] / speed[too_fast])[:, None]
+
+        # Si le boid bouge, on garde sa dernière direction
+        speed = np.hypot(velocities[:, 0], velocities[:, 1])
+        moving = speed > 0
+        self.last_direction[rows[moving]] = velocities[moving] / speed[moving, None]
+
+        # Mise à jour de la position (les boids morts pendant ce pas ne bougent plus)
+        new_positions = positions + velocities
+        with profiler.span("walls"):
+            can_move = self.is_alive[rows] & ~self.map.are_points_in_walls(new_positions)
+        positions[can_move] = new_positions[can_move]
+
+        self.positions[rows] = positions
+        self.velocities[rows] = velocities
+
+        # Vérification des sorties
+        self.check_exit_collisions(rows[self.is_alive[rows]], exit_manager)
+
+    def check_exit_collisions(self, rows, exit_manager):
+        """Met en file les boids arrivés devant une sortie de leur salle"""
+        if rows.size == 0:
+            return
+        rooms = self.current_room[rows]
+        exits = self.exit_positions[rooms]
+        to_exit = exits - self.positions[rows][:, None, :]
+        distance = np.hypot(to_exit[..., 0], to_exit[..., 1])
+        unit = to_exit / np.where(distance > 0, distance, 1.0)[..., None]
+        facing = (unit * self.exit_directions[rooms]).sum(axis=2) > -0.3
+
+        # Zone de détection plus large que la porte, condition d'angle permissive
+        candidates = self.exit_valid[rooms] & (distance < self.exit_widths[rooms] * 0.75) & facing
+
+        # Les files sont limitées : on les remplit dans l'ordre des boids
+        for b in np.flatnonzero(candidates.any(axis=1)):
+            row = rows[b]
+            for k in np.flatnonzero(candidates[b]):
+                exit_id = int(self.exit_ids[rooms[b], k])
+                if exit_manager.try_queue_boid(int(self.ids[row]), exit_id):
+                    self.queued_at_exit[row] = exit_id
+                    self.positions[row] = exits[b, k]
+                    self.velocities[row] = 0
+                    break
+
+    def move_through_exit(self, boid_id, exit_info):
+        """Fait passer un boid par une sortie (équivalent de ExitManager.update_boid_room)"""
+        row = self.index_of(boid_id)
+        if row is None or not exit_info:
+            return False
+        if exit_info["to_room"] is None:  # C'est une sortie finale
+            self.current_room[row] = NO_ROOM
+            self.queued_at_exit[row] = 0
+            return True
+        elif exit_info["spawn_point"]:
+            self.positions[row] = exit_info["spawn_point"]
+            self.current_room[row] = exit_info["to_room"]
+            self.velocities[row] = np.asarray(exit_info["direction"], dtype=float) * MAX_SPEED
+            self.queued_at_exit[row] = 0
+            return True
+        return False
+
+    def remove_escaped(self):
+        """Retire les boids sortis ou morts et renvoie (sortis, morts)"""
+        dead = ~self.is_alive
+        escaped = self.is_alive & (self.current_room == NO_ROOM)
+        keep = ~(dead | escaped)
+        num_escaped, num_dead = int(escaped.sum()), int(dead.sum())
+
+        self.compact(keep)
+        return num_escaped, num_dead
+
+    def compact(self, keep):
+        """Ne garde que les lignes où keep est vrai (l'ordre des ids est conservé)"""
+        if not keep.all():
+            for name in ("ids", "positions", "velocities", "last_direction", "health", "is_alive",
+                         "boid_PR", "current_room", "queued_at_exit", "base_speed"):
+                setattr(self, name, getattr(self, name)[keep])
+
+    def draw(self, screen):
+        """Dessine les boids avec indication de santé (un seul Surface.blits)"""
+        visible = self.is_alive & (self.current_room != NO_ROOM)
+        directions = self.velocities[visible]
+        still = (directions[:, 0] == 0) & (directions[:, 1] == 0)
+        directions[still] = self.last_direction[visible][still]
+        self.sprites.draw(screen, self.positions[visible], directions, self.health[visible],
+                          self.boid_PR[visible], self.queued_at_exit[visible] != 0)
@@ -0,0 +1,225 @@
+import itertools
+import json
+import random
+from collections import deque
+import numpy as np
+from config import *
+from boid import Boid
+from model import EvacuationModel
+from layouts import layout_key
+
+# Bumped whenever the layout of the saved arrays changes
+CHECKPOINT_VERSION = 2
+
+# Per-boid arrays saved for both engines (names of the BoidSwarm attributes)
+BOID_ARRAYS = ("ids", "positions", "velocities", "last_direction", "health", "is_alive",
+               "boid_PR", "current_room", "queued_at_exit", "base_speed")
+
+
+def boid_arrays(model):
+    """Per-boid state as arrays, whatever the engine"""
+    if model.swarm is not None:
+        return {name: getattr(model.swarm, name) for name in BOID_ARRAYS}
+    boids = model.boids
+    return {
+        "ids": np.array([b.boid_id for b in boids], dtype=np.int64),
+        "positions": np.array([(b.position.x, b.position.y) for b in boids]).reshape(-1, 2),
+        "velocities": np.array([(b.velocity.x, b.velocity.y) for b in boids]).reshape(-1, 2),
+        "last_direction": np.array([(b.last_direction.x, b.last_direction.y) for b in boids]).reshape(-1, 2),
+        "health": np.array([b.health for b in boids], dtype=float),
+        "is_alive": np.array([b.is_alive for b in boids], dtype=bool),
+        "boid_PR": np.array([b.boid_PR for b in boids], dtype=np.int8),
+        "current_room": np.array([b.current_room or 0 for b in boids], dtype=np.int32),
+        "queued_at_exit": np.array([b.queued_at_exit or 0 for b in boids], dtype=np.int32),
+        "base_speed": np.array([b.base_speed for b in boids], dtype=float),
+    }
+
+
+def save_checkpoint(model, path):
+    """Write the complete state of model to a compressed .npz file.
+
+    The file holds a JSON header (format version, constructor arguments,
+    counters, RNG states) and one array per piece of simulation state, so
+    load_checkpoint() can rebuild a model that continues exactly where this
+    one stopped.
+    """
+    if model.swarm is not None:
+        next_boid_id = model.swarm.next_id
+    else:
+        # Peek at the shared Boid id counter without consuming an id
+        next_boid_id = next(Boid.ids)
+        Boid.ids = itertools.count(next_boid_id)
+
+    random_version, random_internal, random_gauss = random.getstate()
+    header = {
+        "version": CHECKPOINT_VERSION,
+        "layout": model.map.layout_key,
+        "engine": model.engine,
+        "num_boids": model.num_boids,
+        "seed": model.seed,
+        "crowd_field": model.crowd is not None,
+        "flocking": model.flocking,
+        "simulation_time": model.simulation_time,
+        "step_count": model.step_count,
+        "escaped_boids": model.escaped_boids,
+        "dead_boids": model.dead_boids,
+        "next_boid_id": int(next_boid_id),
+        "fire_source": model.fire_manager.fire_source,
+        "rng_state": model.rng.bit_generator.state,
+        "random_version": random_version,
+        "random_gauss": random_gauss,
+    }
+
+    arrays = {
+        "random_internal": np.array(random_internal, dtype=np.uint32),
+        "smoke_concentration": model.fire_manager.smoke_concentration,
+    }
+    arrays.update({"boid_" + name: values for name, values in boid_arrays(model).items()})
+
+    # Exit queues, flattened: waiting boids in queue order, then boids going through
+    queue_exit, queue_boid = [], []
+    processing_exit, processing_boid, processing_start = [], [], []
+    exit_ids, last_process_time = [], []
+    for exit_id, queue in model.exit_manager.exit_queues.items():
+        for boid in queue.queue:
+            queue_exit.append(exit_id)
+            queue_boid.append(boid if isinstance(boid, int) else boid.boid_id)
+        for boid_id, start_time in queue.processing.items():
+            processing_exit.append(exit_id)
+            processing_boid.append(boid_id)
+            processing_start.append(start_time)
+        exit_ids.append(exit_id)
+        last_process_time.append(queue.last_process_time)
+    arrays.update({
+        "queue_exit": np.array(queue_exit, dtype=np.int32),
+        "queue_boid": np.array(queue_boid, dtype=np.int64),
+        "processing_exit": np.array(processing_exit, dtype=np.int32),
+        "processing_boid": np.array(processing_boid, dtype=np.int64),
+        "processing_start": np.array(processing_start, dtype=float),
+        "exit_ids": np.array(exit_ids, dtype=np.int32),
+        "last_process_time": np.array(last_process_time, dtype=float),
+    })
+
+    crowd = model.crowd
+    if crowd is not None:
+        header["crowd"] = {
+            "escaped": crowd.escaped,
+            "dead": crowd.dead,
+            "reported_escaped": crowd.reported_escaped,
+            "reported_dead": crowd.reported_dead,
+            "rounding": crowd.rounding,
+        }
+        pending = sorted(crowd.pending.items())
+        arrays.update({
+            "crowd_density": crowd.density,
+            "crowd_health_mass": crowd.health_mass,
+            "crowd_pending_exit": np.array([exit_id for exit_id, _ in pending], dtype=np.int32),
+            "crowd_pending": np.array([values for _, values in pending], dtype=float).reshape(-1, 2),
+        })
+
+    np.savez_compressed(path, header=np.array(json.dumps(header)), **arrays)
+
+
+def load_checkpoint(path, model_class=EvacuationModel, seed=None, **kwargs):
+    """Rebuild the model saved in path.
+
+    model_class and kwargs choose what is rebuilt, e.g. a SimulationRecorder
+    with its display options. A seed reseeds both random generators after the
+    restore, so runs branched from one checkpoint with different seeds diverge
+    from the same starting state.
+    """
+    with np.load(path, allow_pickle=False) as data:
+        header = json.loads(str(data["header"]))
+        if header.get("version") != CHECKPOINT_VERSION:
+            raise ValueError(f"Unsupported checkpoint version {header.get('version')} in {path} "
+                             f"(expected {CHECKPOINT_VERSION})")
+        # Content hash of the walls and rooms, so that another layout file with the
+        # same room ids is refused as well
+        if header["layout"] != layout_key(WALLS, ROOMS):
+            raise ValueError(f"Checkpoint {path} was saved with a different building layout")
+
+        model = model_class(engine=header["engine"], num_boids=header["num_boids"], seed=header["seed"],
+                            crowd_field=header["crowd_field"], flocking=header["flocking"], **kwargs)
+        boids = {name: data["boid_" + name] for name in BOID_ARRAYS}
+        restore_boids(model, boids, header["next_boid_id"])
+        restore_exits(model, data)
+
+        fire = model.fire_manager
+        fire.smoke_concentration = data["smoke_concentration"].copy()
+        fire.fire_source = tuple(header["fire_source"]) if header["fire_source"] else None
+
+        if model.crowd is not None:
+            crowd = model.crowd
+            crowd.density = data["crowd_density"].copy()
+            crowd.health_mass = data["crowd_health_mass"].copy()
+            for name, value in header["crowd"].items():
+                setattr(crowd, name, value)
+            crowd.pending = {int(exit_id): [float(count), float(health)]
+                             for exit_id, (count, health) in zip(data["crowd_pending_exit"], data["crowd_pending"])}
+
+        random_internal = tuple(int(value) for value in data["random_internal"])
+
+    model.simulation_time = header["simulation_time"]
+    model.step_count = header["step_count"]
+    model.escaped_boids = header["escaped_boids"]
+    model.dead_boids = header["dead_boids"]
+
+    # Last, so that rebuilding the model above does not disturb the saved states
+    model.rng.bit_generator.state = header["rng_state"]
+    random.setstate((header["random_version"], random_internal, header["random_gauss"]))
+    if seed is not None:
+        model.seed = seed
+        random.seed(seed)
+        model.rng.bit_generator.state = np.random.default_rng(seed).bit_generator.state
+    return model
+
+
+def restore_boids(model, boids, next_boid_id):
+    if model.swarm is not None:
+        swarm = model.swarm
+        for name, values in boids.items():
+            setattr(swarm, name, values.copy())
+        swarm.next_id = next_boid_id
+        return
+
+    model.boids = []
+    for row in range(len(boids["ids"])):
+        x, y = boids["positions"][row]
+        boid = Boid(x, y, model.map, int(boids["current_room"][row]) or None)
+        boid.boid_id = int(boids["ids"][row])
+        boid.velocity.update(*boids["velocities"][row])
+        boid.last_direction.update(*boids["last_direction"][row])
+        boid.health = float(boids["health"][row])
+        boid.is_alive = bool(boids["is_alive"][row])
+        boid.boid_PR = int(boids["boid_PR"][row])
+        boid.queued_at_exit = int(boids["queued_at_exit"][row]) or None
+        boid.base_speed = float(boids["base_speed"][row])
+        model.boids.append(boid)
+    # New Boid objects (e.g. from the crowd) must not reuse a saved id
+    Boid.ids = itertools.count(max(next_boid_id, next(Boid.ids)))
+
+
+def restore_exits(model, data):
+    exit_manager = model.exit_manager
+    by_id = {boid.boid_id: boid for boid in model.boids}
+    exit_manager.queued_boids = {}
+
+    def entry(boid_id):
+        # BoidSwarm queues hold ids, the objects engine holds the Boid itself
+        if model.swarm is not None:
+            return int(boid_id)
+        boid = by_id[int(boid_id)]
+        exit_manager.queued_boids[boid.boid_id] = boid
+        return boid
+
+    for exit_id, time in zip(data["exit_ids"], data["last_process_time"]):
+        queue = exit_manager.exit_queues[int(exit_id)]
+        queue.queue = deque()
+        queue.processing = {}
+        queue.last_process_time = float(time)
+    for exit_id, boid_id in zip(data["queue_exit"], data["queue_boid"]):
+        exit_manager.exit_queues[int(exit_id)].queue.append(entry(boid_id))
+    for exit_id, boid_id, start_time in zip(data["processing_exit"], data["processing_boid"],
+                                            data["processing_start"]):
+        entry(boid_id)
+        exit_manager.exit_queues[int(exit_id)].processing[int(boid_id)] = float(start_time)
@@ -1,3 +1,4 @@
+import os
 import pygame
 
 SMOKE_AVOIDANCE_RADIUS = 100  
@@ -5,9 +6,33 @@ SMOKE_AVOIDANCE_STRENGTH = 1
 SMOKE_DAMAGE_RATE = 0.5
 HEAT_DAMAGE_RATE = 70
 
+# Pas de temps de la simulation (secondes simulées par mise à jour)
+TIME_STEP = 1 / 60
+
 # Window configuration
 WIDTH, HEIGHT = 1600, 1000
 BACKGROUND_COLOR = (30, 30, 30)
+# Images affichées par seconde ; en accéléré, la simulation occupe le reste d'une
+# image à FAST_FORWARD_FPS, dans la limite de MAX_STEPS_PER_FRAME pas par image
+RENDER_FPS = 60
+FAST_FORWARD_FPS = 15
+MAX_STEPS_PER_FRAME = 64
+# Position des moyennes affichées avec --profile
+PROFILE_OVERLAY_POSITION = (10, 200)
+# Ne redessiner que les zones modifiées (boids, fumée, files, HUD) à chaque image
+DIRTY_RECT_RENDERING = False
+# Enregistrement vidéo : images en attente d'encodage, et abandon des images
+# quand la file est pleine (sinon la boucle attend l'encodeur)
+VIDEO_QUEUE_SIZE = 8
+VIDEO_DROP_FRAMES = False
+# Grilles dérivées du plan (murs, champs d'évitement, salles...) gardées sur disque,
+# par empreinte du plan, pour ne pas les recalculer à chaque lancement
+LAYOUT_CACHE = True
+LAYOUT_CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".layout_cache")
+# Trajectoires (--trajectory) : lignes par chunk de colonne avant écriture, et
+# fréquence (en pas) des images de fumée
+TRAJECTORY_CHUNK_ROWS = 65536
+TRAJECTORY_GRID_EVERY = 30
 WALL_COLOR = (100, 100, 100)
 EXIT_COLOR = (0, 255, 100)
 DOOR_COLOR = (200, 200, 0)
@@ -21,12 +46,33 @@ COHESION_STRENGTH = 0.01
 SEPARATION_STRENGTH = 1
 WALL_AVOIDANCE_STRENGTH = 0.1
 EXIT_STRENGTH = 1.5
+# Attraction vers les sorties le long des plus courts chemins autour des murs et
+# des obstacles (FlowField), plutôt qu'en ligne droite
+FLOW_FIELD = True
 MAX_SPEED = 2.5
 VISION_RADIUS = 150
 WALL_DETECTION_DISTANCE = 30
 EXIT_PASS_DISTANCE = 10
 CHANCE_TO_STOP = 0.0
 CHANCE_TO_CHANGE_DIRECTION = 0.5
+# Moteur des boids : "swarm" (tableaux NumPy, BoidSwarm) ou "objects" (une instance Boid par occupant)
+BOID_ENGINE = "swarm"
+# Alignement et cohésion du BoidSwarm : "exact" (paires de voisins dans VISION_RADIUS)
+# ou "grid" (sommes par cellule de FLOCKING_GRID_SIZE px, séparation toujours exacte)
+FLOCKING_MODE = "exact"
+FLOCKING_GRID_SIZE = 10
+# En dessous de ce nombre de boids à diriger, le mode "grid" repasse en "exact" :
+# les paires de voisins y coûtent moins que les tables (croisement vers 300 boids)
+FLOCKING_GRID_MIN_BOIDS = 400
+# Foule continue (densité sur la grille de 4 px) loin de la fumée et du feu, pour
+# simuler de très grands effectifs ; les cellules à moins de CROWD_ROI_MARGIN px
+# d'une fumée au-dessus de CROWD_ROI_SMOKE repassent en agents
+CROWD_FIELD = False
+CROWD_MAX_DENSITY = 0.5  # occupants par cellule à laquelle la foule se bloque
+CROWD_MIN_SPEED_FACTOR = 0.1
+CROWD_ROI_SMOKE = 0.05
+CROWD_ROI_MARGIN = 60
+CROWD_ROI_HYSTERESIS = 20  # px de plus avant qu'un agent ne rejoigne la foule
 
 #Fire and smoke parameters
 HEAT_DAMAGE_RATE = 0.2
@@ -0,0 +1,350 @@
+import numpy as np
+import pygame
+from config import *
+from layouts import layout_cache
+
+
+class CrowdField:
+    """Foule continue pour les occupants hors de la région d'intérêt.
+
+    Hors de la région d'intérêt (autour de la fumée et du feu),
+    les occupants ne sont pas des boids mais une densité (occupants par cellule
+    de 4 px) et une santé cumulée par cellule. À chaque pas, la densité avance
+    vers la sortie la plus proche de sa salle (schéma décentré amont), ralentie
+    par l'encombrement et la fumée ; chaque porte laisse passer au plus
+    flow_rate occupants par seconde, comme les files de sortie des boids. Les
+    cellules qui entrent dans la région d'intérêt sont rendues sous forme
+    d'agents par take_region(), et les agents qui s'en éloignent sont absorbés.
+    """
+
+    def __init__(self, game_map, rng=None):
+        self.map = game_map
+        self.rng = rng if rng is not None else np.random.default_rng()
+        self.cell_size = game_map.grid_size
+        self.shape = (HEIGHT // self.cell_size, WIDTH // self.cell_size)
+
+        self.density = np.zeros(self.shape)
+        self.health_mass = np.zeros(self.shape)  # somme des points de vie par cellule
+        # Cellules simulées par des agents, et zone un peu plus large où les agents
+        # restent agents (évite les allers-retours à la frontière)
+        self.region = np.zeros(self.shape, dtype=bool)
+        self.agent_zone = np.zeros(self.shape, dtype=bool)
+
+        # Personnes sorties ou mortes dans la foule, parties fractionnaires comprises
+        self.escaped = 0.0
+        self.dead = 0.0
+        self.reported_escaped = 0
+        self.reported_dead = 0
+        # Occupants en transit vers la région d'intérêt : {exit_id: [nombre, santé cumulée]}
+        self.pending = {}
+        # Report d'arrondi de take_region(), dans [0, 1)
+        self.rounding = self.rng.random()
+
+        # Avec une carte render_only (replay), la foule est seulement dessinée :
+        # ni salles, ni directions, ni portes
+        if not game_map.render_only:
+            self.init_rooms()
+            self.init_directions()
+            self.init_exit_zones()
+            self.init_neighbors()
+
+        self.cells = None
+        self.overlay = None
+
+    def init_rooms(self):
+        """Salle de chaque cellule praticable (0 pour les murs et l'extérieur)"""
+        walkable = ~self.map.collision_mask[1:-1, 1:-1]
+        cell_y, cell_x = np.mgrid[0:self.shape[0], 0:self.shape[1]]
+        self.centers_x = (cell_x + 0.5) * self.cell_size
+        self.centers_y = (cell_y + 0.5) * self.cell_size
+
+        self.room_of_cell = np.zeros(self.shape, dtype=np.int32)
+        self.room_slices = {}
+        for room_id, room in ROOMS.items():
+            x, y, w, h = room["bounds"]
+            rows = slice(y // self.cell_size, -(-(y + h) // self.cell_size))
+            cols = slice(x // self.cell_size, -(-(x + w) // self.cell_size))
+            self.room_slices[room_id] = (rows, cols)
+            inside = ((self.centers_x[rows, cols] > x) & (self.centers_x[rows, cols] < x + w) &
+                      (self.centers_y[rows, cols] > y) & (self.centers_y[rows, cols] < y + h))
+            self.room_of_cell[rows, cols][inside & walkable[rows, cols]] = room_id
+
+        # Cellule praticable la plus proche dans la salle, pour déposer les agents
+        # qui se trouvent dans la marge d'un mur ou d'un obstacle
+        self.room_cell = {}
+        flat_index = np.arange(self.room_of_cell.size).reshape(self.shape)
+        for room_id, (rows, cols) in self.room_slices.items():
+            nearest = np.where(self.room_of_cell[rows, cols] == room_id, flat_index[rows, cols], -1)
+            while (nearest < 0).any():
+                grown = nearest.copy()
+                for shifted, target in (((slice(None), slice(1, None)), (slice(None), slice(None, -1))),
+                                        ((slice(None), slice(None, -1)), (slice(None), slice(1, None))),
+                                        ((slice(1, None), slice(None)), (slice(None, -1), slice(None))),
+                                        ((slice(None, -1), slice(None)), (slice(1, None), slice(None)))):
+                    fill = (grown[target] < 0) & (nearest[shifted] >= 0)
+                    grown[target][fill] = nearest[shifted][fill]
+                if (grown == nearest).all():
+                    break
+                nearest = grown
+            self.room_cell[room_id] = nearest
+
+    def init_directions(self):
+        """Direction de chaque cellule vers la sortie la plus proche de sa salle (cache du plan)"""
+        name = "crowd_directions" if self.map.flow_field is None else "crowd_flow_directions"
+        self.directions = layout_cache.get(self.map.layout_key, (name,),
+                                           lambda: {name: self.compute_directions()})[name]
+
+    def compute_directions(self):
+        self.directions = np.zeros(self.shape + (2,))
+        best = np.full(self.shape, np.inf)
+        for room_id, room in ROOMS.items():
+            in_room = self.room_of_cell == room_id
+            for exit_info in room["exits"]:
+                ex, ey = exit_info["position"]
+                dx = np.where(in_room, ex - self.centers_x, 0.0)
+                dy = np.where(in_room, ey - self.centers_y, 0.0)
+                distance = np.hypot(dx, dy)
+                closer = in_room & (distance < best)
+                best[closer] = distance[closer]
+                safe = np.where(distance > 0, distance, 1.0)
+                self.directions[closer] = np.column_stack((dx[closer] / safe[closer], dy[closer] / safe[closer]))
+
+        flow_field = self.map.flow_field
+        if flow_field is not None:
+            # Sortie au plus court chemin autour des obstacles ; la ligne droite
+            # ci-dessus reste pour les cellules d'où aucune n'est atteignable
+            nearest = np.argmin(flow_field.distance, axis=0)
+            reachable = np.isfinite(np.min(flow_field.distance, axis=0)) & (self.room_of_cell > 0)
+            along = np.take_along_axis(flow_field.direction, nearest[None, ..., None], axis=0)[0]
+            self.directions[reachable] = along[reachable]
+        return self.directions
+
+    def init_neighbors(self):
+        """Voisins vers lesquels la foule peut avancer : même salle, pas de mur"""
+        room = self.room_of_cell
+        self.open_east = np.zeros(self.shape, dtype=bool)
+        self.open_east[:, :-1] = (room[:, :-1] == room[:, 1:]) & (room[:, :-1] > 0)
+        self.open_south = np.zeros(self.shape, dtype=bool)
+        self.open_south[:-1, :] = (room[:-1, :] == room[1:, :]) & (room[:-1, :] > 0)
+        self.open_west = np.zeros(self.shape, dtype=bool)
+        self.open_west[:, 1:] = self.open_east[:, :-1]
+        self.open_north = np.zeros(self.shape, dtype=bool)
+        self.open_north[1:, :] = self.open_south[:-1, :]
+
+    def init_exit_zones(self):
+        """Cellules d'où la foule passe une porte (même rayon de détection que les boids)"""
+        self.exit_zones = []
+        for room_id, room in ROOMS.items():
+            for exit_info in room["exits"]:
+                ex, ey = exit_info["position"]
+                near = np.hypot(self.centers_x - ex, self.centers_y - ey) < exit_info["width"] * 0.75
+                cells = np.flatnonzero(near & (self.room_of_cell == room_id))
+                self.exit_zones.append((room_id, exit_info, cells))
+
+    def population(self):
+        return float(self.density.sum())
+
+    @staticmethod
+    def grow(mask, radius):
+        """Dilatation carrée d'une grille booléenne, en O(cellules) par sommes cumulées"""
+        if radius <= 0:
+            return mask.copy()
+        result = mask
+        for axis in (0, 1):
+            counts = np.cumsum(result, axis=axis, dtype=np.int32)
+            counts = np.concatenate((np.zeros_like(counts.take([0], axis=axis)), counts), axis=axis)
+            size = result.shape[axis]
+            upper = np.minimum(np.arange(size) + radius + 1, size)
+            lower = np.maximum(np.arange(size) - radius, 0)
+            result = (counts.take(upper, axis=axis) - counts.take(lower, axis=axis)) > 0
+        return result
+
+    def update_region(self, fire_manager=None):
+        """Région d'intérêt : cellules proches de la fumée ou du feu"""
+        region = np.zeros(self.shape, dtype=bool)
+        if fire_manager:
+            region |= fire_manager.smoke_concentration > CROWD_ROI_SMOKE
+            if fire_manager.fire_source:
+                fx, fy = fire_manager.fire_source
+                region[fy, fx] = True
+        margin = CROWD_ROI_MARGIN // self.cell_size
+        self.region = self.grow(region, margin)
+        self.agent_zone = self.grow(self.region, CROWD_ROI_HYSTERESIS // self.cell_size)
+
+    def cells_of(self, xs, ys, room_id):
+        """Indices (à plat) des cellules de la salle où déposer des occupants"""
+        rows, cols = self.room_slices[room_id]
+        nearest = self.room_cell[room_id]
+        grid_x = np.floor(np.asarray(xs, dtype=float) / self.cell_size).astype(np.int64) - cols.start
+        grid_y = np.floor(np.asarray(ys, dtype=float) / self.cell_size).astype(np.int64) - rows.start
+        grid_x = np.clip(grid_x, 0, nearest.shape[1] - 1)
+        grid_y = np.clip(grid_y, 0, nearest.shape[0] - 1)
+        return nearest[grid_y, grid_x]
+
+    def outside_agent_zone(self, xs, ys):
+        """Positions assez loin de la région d'intérêt pour rejoindre la foule"""
+        grid_x = np.clip(np.floor(np.asarray(xs) / self.cell_size).astype(np.int64), 0, self.shape[1] - 1)
+        grid_y = np.clip(np.floor(np.asarray(ys) / self.cell_size).astype(np.int64), 0, self.shape[0] - 1)
+        return ~self.agent_zone[grid_y, grid_x]
+
+    def add_people(self, xs, ys, room_ids, health):
+        """Dépose des occupants (agents absorbés) dans la cellule de leur salle"""
+        xs, ys = np.atleast_1d(xs), np.atleast_1d(ys)
+        room_ids = np.broadcast_to(room_ids, xs.shape)
+        health = np.broadcast_to(health, xs.shape)
+        for room_id in np.unique(room_ids):
+            mine = room_ids == room_id
+            cells = self.cells_of(xs[mine], ys[mine], int(room_id))
+            np.add.at(self.density.reshape(-1), cells, 1.0)
+            np.add.at(self.health_mass.reshape(-1), cells, health[mine])
+
+    def take_region(self):
+        """Retire la foule de la région d'intérêt et renvoie (xs, ys, salles, santé) des agents à créer"""
+        cells = np.flatnonzero(self.region.ravel() & (self.density.ravel() > 0))
+        density = self.density.reshape(-1)[cells]
+        health_mass = self.health_mass.reshape(-1)[cells]
+        self.density.reshape(-1)[cells] = 0.0
+        self.health_mass.reshape(-1)[cells] = 0.0
+
+        # Tirage systématique : juste en moyenne par cellule ; la partie fractionnaire
+        # restante est reportée au prochain appel, si bien que le total est conservé
+        cumulative = np.floor(np.cumsum(density) + self.rounding)
+        counts = np.diff(cumulative, prepend=0).astype(np.int64)
+        if cells.size:
+            self.rounding += density.sum() - cumulative[-1]
+        cell_y, cell_x = np.unravel_index(np.repeat(cells, counts), self.shape)
+        health = np.repeat(health_mass / np.where(density > 0, density, 1.0), counts)
+        xs = (cell_x + self.rng.random(len(cell_x))) * self.cell_size
+        ys = (cell_y + self.rng.random(len(cell_y))) * self.cell_size
+        return xs, ys, self.room_of_cell[cell_y, cell_x], np.clip(health, 0.0, 100.0)
+
+    def update(self, fire_manager=None, exit_manager=None, current_time=0.0):
+        """Avance la foule d'un pas ; renvoie les arrivées [(exit_info, nombre, santé)] dans la région d'intérêt"""
+        density, health_mass = self.density, self.health_mass
+
+        smoke = fire_manager.smoke_concentration if fire_manager else np.zeros(self.shape)
+        if fire_manager:
+            damage = smoke * SMOKE_DAMAGE_RATE
+            if fire_manager.fire_source:
+                fx, fy = fire_manager.fire_source
+                damage[fy, fx] += HEAT_DAMAGE_RATE
+            health_mass -= density * damage
+            dying = (density > 0) & (health_mass <= 0)
+            self.dead += density[dying].sum()
+            density[dying] = 0.0
+            health_mass[dying] = 0.0
+
+        # Vitesse : diminue avec la densité (jusqu'à un plancher) et dans la fumée
+        congestion = np.maximum(CROWD_MIN_SPEED_FACTOR, 1 - density / CROWD_MAX_DENSITY)
+        speed = MAX_SPEED * congestion * (1 - smoke * SMOKE_SLOWDOWN_FACTOR)
+        fraction_x = self.directions[..., 0] * speed / self.cell_size
+        fraction_y = self.directions[..., 1] * speed / self.cell_size
+
+        # Un flux vers un mur ou une autre salle est bloqué : la foule glisse le long
+        to_east = np.where(self.open_east, np.maximum(fraction_x, 0), 0.0)
+        to_west = np.where(self.open_west, np.maximum(-fraction_x, 0), 0.0)
+        to_south = np.where(self.open_south, np.maximum(fraction_y, 0), 0.0)
+        to_north = np.where(self.open_north, np.maximum(-fraction_y, 0), 0.0)
+
+        for values in (density, health_mass):
+            moved_east, moved_west = values * to_east, values * to_west
+            moved_south, moved_north = values * to_south, values * to_north
+            values -= moved_east + moved_west + moved_south + moved_north
+            values[:, 1:] += moved_east[:, :-1]
+            values[:, :-1] += moved_west[:, 1:]
+            values[1:, :] += moved_south[:-1, :]
+            values[:-1, :] += moved_north[1:, :]
+
+        arrivals = self.pass_exits(exit_manager, current_time)
+
+        # Résidus numériques du schéma amont
+        tiny = density < 1e-6
+        density[tiny] = 0.0
+        health_mass[tiny] = 0.0
+        return arrivals
+
+    def pass_exits(self, exit_manager=None, current_time=0.0):
+        """Fait passer les portes à au plus flow_rate occupants par seconde.
+
+        Avec exit_manager, le débit est pris sur celui de la file de boids de la
+        même porte (ExitQueue.take_crowd_flow), pour que la porte ne laisse pas
+        passer deux fois son débit quand boids et foule l'utilisent.
+        """
+        flat_density = self.density.reshape(-1)
+        flat_health = self.health_mass.reshape(-1)
+        arrivals = []
+        for room_id, exit_info, cells in self.exit_zones:
+            waiting = flat_density[cells].sum()
+            if waiting <= 0:
+                continue
+            capacity = exit_info["flow_rate"] * TIME_STEP
+            if exit_manager is not None:
+                capacity = exit_manager.exit_queues[exit_info["id"]].take_crowd_flow(current_time, min(waiting, capacity))
+                if capacity <= 0:
+                    continue
+            share = min(1.0, capacity / waiting)
+            people = flat_density[cells] * share
+            health = flat_health[cells] * share
+            flat_density[cells] -= people
+            flat_health[cells] -= health
+            count, health_total = people.sum(), health.sum()
+
+            to_room = exit_info["to_room"]
+            if to_room is None:
+                self.escaped += count
+                continue
+            cell = self.cells_of(*exit_info["spawn_point"], to_room)
+            if not self.region.reshape(-1)[cell]:
+                flat_density[cell] += count
+                flat_health[cell] += health_total
+                continue
+
+            # Arrivée dans la région d'intérêt : des agents entiers sortent au fil de l'eau
+            pending = self.pending.setdefault(exit_info["id"], [0.0, 0.0])
+            pending[0] += count
+            pending[1] += health_total
+            if pending[0] >= 1:
+                agents = int(pending[0])
+                mean_health = pending[1] / pending[0]
+                pending[0] -= agents
+                pending[1] = mean_health * pending[0]
+                arrivals.append((exit_info, agents, mean_health))
+        return arrivals
+
+    def take_counts(self):
+        """Nouveaux occupants entièrement sortis et morts depuis le dernier appel"""
+        escaped = int(self.escaped) - self.reported_escaped
+        dead = int(self.dead) - self.reported_dead
+        self.reported_escaped += escaped
+        self.reported_dead += dead
+        return escaped, dead
+
+    def draw(self, screen, areas=None):
+        """Dessine la densité de la foule en bleu, plus opaque là où elle est dense"""
+        if self.cells is None:
+            self.cells = pygame.Surface((self.shape[1], self.shape[0]), pygame.SRCALPHA)
+            self.cells.fill((80, 160, 255, 0))
+            self.overlay = pygame.Surface((WIDTH, HEIGHT), pygame.SRCALPHA)
+
+        alpha = (np.minimum(1.0, self.density / CROWD_MAX_DENSITY) * 200).astype(np.uint8)
+        pixels = pygame.surfarray.pixels_alpha(self.cells)
+        pixels[...] = alpha.T
+        del pixels
+
+        pygame.transform.smoothscale(self.cells, (WIDTH, HEIGHT), self.overlay)
+        if areas is None:
+            screen.blit(self.overlay, (0, 0))
+        else:
+            for area in areas:
+                screen.blit(self.overlay, area, area)
+
+    def bounds(self):
+        """Rectangle d'écran couvrant toute la foule continue (None si elle est vide)"""
+        rows = np.flatnonzero((self.density > 0).any(axis=1))
+        if rows.size == 0:
+            return None
+        cols = np.flatnonzero((self.density[rows[0]:rows[-1] + 1] > 0).any(axis=0))
+        # Deux cellules de marge pour le flou de smoothscale
+        return pygame.Rect(int((cols[0] - 2) * self.cell_size), int((rows[0] - 2) * self.cell_size),
+                           int((cols[-1] - cols[0] + 5) * self.cell_size),
+                           int((rows[-1] - rows[0] + 5) * self.cell_size))
@@ -1,14 +1,16 @@
 import pygame
 from collections import deque
-import time
 from config import *
+from text_cache import text_cache
 
 class ExitQueue:
     def __init__(self, exit_info):
         self.exit_info = exit_info
         self.queue = deque()
         self.processing = {}  # {boid_id: start_time}
-        self.last_process_time = time.time()
+        # Temps de simulation (secondes) et non temps réel, pour que le débit
+        # des portes ne dépende pas de la vitesse d'exécution
+        self.last_process_time = 0.0
         
     def can_add(self):
         return len(self.queue) < EXIT_QUEUE_MAX_SIZE
@@ -19,11 +21,29 @@ class ExitQueue:
             return True
         return False
         
-    def start_processing(self, boid):
-        self.processing[id(boid)] = time.time()
+    def start_processing(self, boid, current_time):
+        # Les boids de BoidSwarm sont mis en file par leur identifiant entier
+        boid_id = boid if isinstance(boid, int) else boid.boid_id
+        self.processing[boid_id] = current_time
         
-    def update(self):
-        current_time = time.time()
+    def take_crowd_flow(self, current_time, wanted):
+        """Part du débit de la porte laissée à la foule continue pendant ce pas.
+
+        Les boids en file passent d'abord ; la foule n'utilise que le temps de
+        porte libre depuis le dernier passage, et le réserve comme le ferait
+        un boid, si bien que boids et foule ensemble ne dépassent pas flow_rate.
+        """
+        if self.queue or wanted <= 0:
+            return 0.0
+        wait_time = 1.0 / self.exit_info["flow_rate"]
+        start = max(current_time, self.last_process_time + wait_time)
+        granted = min(wanted, max(0.0, current_time + TIME_STEP - start) * self.exit_info["flow_rate"])
+        if granted > 0:
+            # Porte occupée par la foule jusqu'à start + granted * wait_time
+            self.last_process_time = start + (granted - 1) * wait_time
+        return granted
+
+    def update(self, current_time):
         processed_boids = []
         
         # Process waiting boids
@@ -31,7 +51,7 @@ class ExitQueue:
             wait_time = 1.0 / self.exit_info["flow_rate"]
             if current_time - self.last_process_time >= wait_time:
                 boid = self.queue.popleft()
-                self.start_processing(boid)
+                self.start_processing(boid, current_time)
                 self.last_process_time = current_time
         
         # Check for completed processing
@@ -47,19 +67,19 @@ class ExitManager:
     def __init__(self, rooms):
         self.rooms = rooms
         self.exit_queues = {}
+        self.exits = {}  # {exit_id: exit_info}
+        # Boid objects waiting at or going through an exit, by boid_id
+        self.queued_boids = {}
         self.initialize_queues()
         
     def initialize_queues(self):
         for room_id, room in self.rooms.items():
             for exit_info in room["exits"]:
+                self.exits[exit_info["id"]] = exit_info
                 self.exit_queues[exit_info["id"]] = ExitQueue(exit_info)
                 
     def get_exit_info(self, exit_id):
-        for room in self.rooms.values():
-            for exit_info in room["exits"]:
-                if exit_info["id"] == exit_id:
-                    return exit_info
-        return None
+        return self.exits.get(exit_id)
         
     def update_boid_room(self, boid, exit_info):
         if exit_info:
@@ -80,28 +100,36 @@ class ExitManager:
         
     def try_queue_boid(self, boid, exit_id):
         if exit_id in self.exit_queues:
-            return self.exit_queues[exit_id].add_boid(boid)
+            added = self.exit_queues[exit_id].add_boid(boid)
+            if added and not isinstance(boid, int):
+                self.queued_boids[boid.boid_id] = boid
+            return added
         return False
         
-    def update(self, boids):
+    def update(self, current_time):
         for exit_id, queue in self.exit_queues.items():
-            processed = queue.update()
+            processed = queue.update(current_time)
             for boid_id, exit_info in processed:
-                # Find the corresponding boid
-                for boid in boids:
-                    if id(boid) == boid_id:
-                        self.update_boid_room(boid, exit_info)
-                        break
+                boid = self.queued_boids.pop(boid_id, None)
+                if boid is not None:
+                    self.update_boid_room(boid, exit_info)
 
-    def draw_queues(self, screen):
+    def update_swarm(self, swarm, current_time):
         for exit_id, queue in self.exit_queues.items():
-            if queue.queue or queue.processing:
-                exit_info = self.get_exit_info(exit_id)
+            for boid_id, exit_info in queue.update(current_time):
+                swarm.move_through_exit(boid_id, exit_info)
+
+    def draw_queues(self, screen):
+        self.draw_queue_counts(screen, {exit_id: len(queue.queue) + len(queue.processing)
+                                        for exit_id, queue in self.exit_queues.items()})
+
+    def draw_queue_counts(self, screen, counts):
+        """Draw the exits with boids waiting or going through, counts being {exit_id: count}"""
+        for exit_id, count in counts.items():
+            if count:
+                exit_info = self.exits[exit_id]
                 pos = exit_info["position"]
                 # Draw exit area
                 pygame.draw.circle(screen, EXIT_COLOR, pos, exit_info["width"]//2, 2)
                 # Draw queue count
-                font = pygame.font.Font(None, 24)
-                count = len(queue.queue) + len(queue.processing)
-                text = font.render(str(count), True, (255, 255, 255))
-                screen.blit(text, (pos[0] - 5, pos[1] - 20))
\ No newline at end of file
+                text_cache.draw(screen, str(count), (pos[0] - 5, pos[1] - 20), 24, (255, 255, 255))
\ No newline at end of file
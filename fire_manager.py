@@ -2,10 +2,15 @@ import numpy as np
 import pygame 
 import random
 from config import *
+from profiling import profiler
+from layouts import layout_cache, layout_key
 
 class FireManager:
-    def __init__(self, rooms):
+    def __init__(self, rooms, reference_mode=False, rng=None):
         self.rooms = rooms
+        # reference_mode : ancienne boucle Python, gardée pour valider la version vectorisée
+        self.reference_mode = reference_mode
+        self.rng = rng if rng is not None else np.random.default_rng()
         self.Nx = WIDTH // 4
         self.Ny = HEIGHT // 4
         self.dx = WIDTH / self.Nx
@@ -14,13 +19,20 @@ class FireManager:
         # Grille de fumée
         self.smoke_concentration = np.zeros((self.Ny, self.Nx))
         # Grille des murs (True = mur ou sortie extérieure, False = passage possible)
-        self.wall_grid = np.zeros((self.Ny, self.Nx), dtype=bool)
-        self.init_grids()
+        self.wall_grid = layout_cache.get(layout_key(WALLS, rooms), ("smoke_walls",), self.init_grids)["smoke_walls"]
+
+        # Cellules parcourues par la boucle de propagation (bords exclus)
+        self.interior = np.zeros((self.Ny, self.Nx), dtype=bool)
+        self.interior[1:-1, 1:-1] = True
         
         # Point de départ du feu
         self.fire_source = None
         self.init_first_fire()
         
+        # Surfaces de rendu de la fumée, créées au premier draw puis réutilisées
+        self.smoke_cells = None
+        self.smoke_overlay = None
+
         # Paramètres
         self.propagation_chance = 0.3
         self.smoke_increment = 0.2
@@ -28,6 +40,7 @@ class FireManager:
 
     def init_grids(self):
         """Initialise la grille des murs en laissant des passages uniquement aux portes intérieures"""
+        self.wall_grid = np.zeros((self.Ny, self.Nx), dtype=bool)
         # D'abord marquer tous les murs
         for wall in WALLS:
             x1 = max(0, min(self.Nx - 1, int(wall.left / self.dx)))
@@ -55,6 +68,7 @@ class FireManager:
                         grid_y = door_y + dy
                         if 0 <= grid_x < self.Nx and 0 <= grid_y < self.Ny:
                             self.wall_grid[grid_y, grid_x] = False
+        return {"smoke_walls": self.wall_grid}
 
     def init_first_fire(self):
         room_id = random.choice(list(self.rooms.keys()))
@@ -68,6 +82,59 @@ class FireManager:
         self.smoke_concentration[self.fire_source[1], self.fire_source[0]] = 1.0
 
     def update(self):
+        if self.reference_mode:
+            self.update_reference()
+        else:
+            self.update_vectorized()
+
+    def update_vectorized(self):
+        """Propagation de la fumée sur toute la grille en opérations NumPy.
+
+        Reproduit update_reference : la boucle parcourt les colonnes puis les
+        lignes, donc une cellule reçoit la fumée de ses voisins de gauche et du
+        haut avant sa dissipation, et celle de droite et du bas après.
+        """
+        smoke = self.smoke_concentration
+        new_smoke = np.copy(smoke)
+
+        # Ajouter constamment de la fumée à la source
+        if self.fire_source:
+            new_smoke[self.fire_source[1], self.fire_source[0]] = 1.0
+
+        open_cells = ~self.wall_grid
+        emitting = self.interior & open_cells & (smoke > 0.1)
+        num_emitting = np.count_nonzero(emitting)
+        profiler.count("smoke_cells_emitting", num_emitting)
+
+        received_before = np.zeros((self.Ny, self.Nx))
+        received_after = np.zeros((self.Ny, self.Nx))
+        for dx, dy in [(0, 1), (0, -1), (1, 0), (-1, 0)]:
+            spread = np.zeros((self.Ny, self.Nx), dtype=bool)
+            spread[emitting] = self.rng.random(num_emitting) < self.propagation_chance
+
+            # Décaler la grille des émissions vers la cellule voisine (j+dy, i+dx)
+            received = np.zeros((self.Ny, self.Nx))
+            received[max(dy, 0):self.Ny + min(dy, 0), max(dx, 0):self.Nx + min(dx, 0)] = \
+                spread[max(-dy, 0):self.Ny + min(-dy, 0), max(-dx, 0):self.Nx + min(-dx, 0)]
+            received *= open_cells
+
+            if dx > 0 or dy > 0:
+                received_before += received
+            else:
+                received_after += received
+
+        new_smoke = np.minimum(1.0, new_smoke + received_before * self.smoke_increment)
+
+        # natural dissipation
+        dissipating = self.interior & open_cells
+        new_smoke[dissipating] = np.maximum(0, new_smoke[dissipating] - self.dissipation_rate)
+
+        new_smoke = np.minimum(1.0, new_smoke + received_after * self.smoke_increment)
+        new_smoke[self.interior & self.wall_grid] = 0
+
+        self.smoke_concentration = new_smoke
+
+    def update_reference(self):
         new_smoke = np.copy(self.smoke_concentration)
         
         # Ajouter constamment de la fumée à la source
@@ -113,21 +180,60 @@ class FireManager:
             return 1.0
         return 0
 
-    def draw(self, screen):
-        smoke_surf = pygame.Surface((WIDTH, HEIGHT), pygame.SRCALPHA)
-        
-        for i in range(self.Nx):
-            for j in range(self.Ny):
-                value = self.smoke_concentration[j,i]
-                if value > 0.01:
-                    alpha = int(180 * value)
-                    color = (100, 100, 100, alpha)
-                    pygame.draw.rect(smoke_surf, color,
-                                   (i*self.dx, j*self.dy, self.dx+1, self.dy+1))
-        
-        screen.blit(smoke_surf, (0, 0))
+    def grid_indices(self, xs, ys):
+        # int() tronque vers zéro, comme get_smoke_at_position
+        grid_x = np.trunc(np.asarray(xs, dtype=float) / self.dx).astype(np.int64)
+        grid_y = np.trunc(np.asarray(ys, dtype=float) / self.dy).astype(np.int64)
+        return grid_x, grid_y
+
+    def sample_smoke(self, xs, ys):
+        """Version vectorisée de get_smoke_at_position pour des tableaux de positions"""
+        grid_x, grid_y = self.grid_indices(xs, ys)
+        inside = (grid_x >= 0) & (grid_x < self.Nx) & (grid_y >= 0) & (grid_y < self.Ny)
+        values = self.smoke_concentration[np.where(inside, grid_y, 0), np.where(inside, grid_x, 0)]
+        return np.where(inside, values, 0.0)
+
+    def sample_temperature(self, xs, ys):
+        """Version vectorisée de get_temperature_at_position"""
+        grid_x, grid_y = self.grid_indices(xs, ys)
+        if not self.fire_source:
+            return np.zeros(grid_x.shape)
+        return ((grid_x == self.fire_source[0]) & (grid_y == self.fire_source[1])).astype(float)
+
+    def smoke_bounds(self):
+        """Rectangle d'écran couvrant toute la fumée visible (None s'il n'y en a pas)"""
+        rows = np.flatnonzero((self.smoke_concentration > 0.01).any(axis=1))
+        if rows.size == 0:
+            return None
+        cols = np.flatnonzero((self.smoke_concentration[rows[0]:rows[-1] + 1] > 0.01).any(axis=0))
+        # Deux cellules de marge pour le flou de smoothscale et le marqueur du feu
+        left = (cols[0] - 2) * self.dx
+        top = (rows[0] - 2) * self.dy
+        return pygame.Rect(int(left), int(top), int((cols[-1] - cols[0] + 5) * self.dx),
+                           int((rows[-1] - rows[0] + 5) * self.dy))
+
+    def draw(self, screen, areas=None):
+        """Dessine la fumée sur tout l'écran, ou seulement dans les rectangles areas"""
+        if self.smoke_cells is None:
+            # Une cellule de grille = un pixel, couleur fixe, seule l'alpha varie
+            self.smoke_cells = pygame.Surface((self.Nx, self.Ny), pygame.SRCALPHA)
+            self.smoke_cells.fill((100, 100, 100, 0))
+            self.smoke_overlay = pygame.Surface((WIDTH, HEIGHT), pygame.SRCALPHA)
+
+        value = self.smoke_concentration
+        alpha = np.where(value > 0.01, 180 * value, 0).astype(np.uint8)
+        pixels = pygame.surfarray.pixels_alpha(self.smoke_cells)
+        pixels[...] = alpha.T  # surfarray est indexé (x, y)
+        del pixels  # libère le verrou de la surface
+
+        pygame.transform.smoothscale(self.smoke_cells, (WIDTH, HEIGHT), self.smoke_overlay)
+        if areas is None:
+            screen.blit(self.smoke_overlay, (0, 0))
+        else:
+            for area in areas:
+                screen.blit(self.smoke_overlay, area, area)
         
         if self.fire_source:
             x = int(self.fire_source[0] * self.dx)
             y = int(self.fire_source[1] * self.dy)
-            pygame.draw.circle(screen, (255, 0, 0), (x, y), 5)
\ No newline at end of file
+            pygame.draw.circle(screen, (255, 0, 0), (x, y), 5)
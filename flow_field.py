@@ -0,0 +1,124 @@
+import numpy as np
+from layouts import layout_cache
+
+# The 8 neighbors of a cell, with the length of the step to them (in cells)
+NEIGHBORS = [(dy, dx, float(np.hypot(dy, dx))) for dy in (-1, 0, 1) for dx in (-1, 0, 1) if dy or dx]
+
+
+class FlowField:
+    """Shortest walkable paths from every cell to each exit of its room.
+
+    For the k-th exit of a room (its slot, in the order of room["exits"]),
+    distance[k] holds the length in pixels of the shortest path around walls
+    and obstacles from each cell of the room to that exit, and direction[k]
+    the unit heading to follow from the cell. A cell only stores the exits of
+    its own room, so both fields are indexed by slot rather than by exit id,
+    and a boid reads the headings to all the exits of its room with one
+    lookup. Cells an exit cannot be reached from hold an infinite distance.
+    """
+
+    FIELDS = ("flow_distance", "flow_direction")
+
+    def __init__(self, game_map):
+        self.map = game_map
+        self.cell_size = game_map.grid_size
+        self.shape = (game_map.grid_height, game_map.grid_width)
+        self.max_exits = max(len(room["exits"]) for room in game_map.rooms.values())
+        fields = layout_cache.get(game_map.layout_key, self.FIELDS, self.compute)
+        self.distance = fields["flow_distance"]
+        self.direction = fields["flow_direction"]
+
+    def compute(self):
+        walkable = ~self.map.collision_mask[1:-1, 1:-1]
+        cell_y, cell_x = np.mgrid[0:self.shape[0], 0:self.shape[1]]
+        centers_x = (cell_x + 0.5) * self.cell_size
+        centers_y = (cell_y + 0.5) * self.cell_size
+
+        distance = np.full((self.max_exits,) + self.shape, np.inf, dtype=np.float32)
+        direction = np.zeros((self.max_exits,) + self.shape + (2,), dtype=np.float32)
+        for room in self.map.rooms.values():
+            x, y, w, h = room["bounds"]
+            rows = slice(max(0, y // self.cell_size), -(-(y + h) // self.cell_size))
+            cols = slice(max(0, x // self.cell_size), -(-(x + w) // self.cell_size))
+            cx, cy = centers_x[rows, cols], centers_y[rows, cols]
+            # Same cells as the room of CrowdField: walkable, center strictly inside
+            inside = walkable[rows, cols] & (cx > x) & (cx < x + w) & (cy > y) & (cy < y + h)
+            if not inside.any():
+                continue
+
+            for k, exit_info in enumerate(room["exits"]):
+                ex, ey = exit_info["position"]
+                to_x, to_y = ex - cx, ey - cy
+                straight = np.hypot(to_x, to_y)
+                # Cells that see the cell of the room closest to the exit go straight to
+                # it, as without flow fields; the paths of the others start from them
+                nearest = np.unravel_index(np.argmin(np.where(inside, straight, np.inf)), straight.shape)
+                anchor = (cx[nearest], cy[nearest])
+                starts = np.stack((cx, cy), axis=-1)
+                goal = inside & self.map.are_lines_of_sight_clear(starts, np.broadcast_to(anchor, starts.shape))
+                goal[nearest] = True
+
+                cells = self.propagate(np.where(goal, straight / self.cell_size, np.inf), inside)
+                heading = self.descent(cells)
+                flat = goal | ((heading[..., 0] == 0) & (heading[..., 1] == 0))
+                safe = np.where(straight > 0, straight, 1.0)
+                heading[flat] = np.column_stack((to_x[flat] / safe[flat], to_y[flat] / safe[flat]))
+
+                distance[k, rows, cols][inside] = cells[inside] * self.cell_size
+                direction[k, rows, cols][inside] = heading[inside]
+        return {"flow_distance": distance, "flow_direction": direction}
+
+    @staticmethod
+    def shifted(grid, dy, dx, fill):
+        """grid[i + dy, j + dx] for every cell (i, j), fill outside the grid"""
+        padded = np.pad(grid, 1, constant_values=fill)
+        height, width = grid.shape
+        return padded[1 + dy:1 + dy + height, 1 + dx:1 + dx + width]
+
+    def propagate(self, cells, passable):
+        """Shortest 8-connected path lengths (in cells) from the finite cells of cells.
+
+        Every pass relaxes all cells at once against their 8 neighbors, so it
+        converges after as many passes as the longest path has steps. Diagonal
+        steps need both cells beside them to be passable, so paths do not cut
+        the corners of walls and obstacles.
+        """
+        steps = []
+        for dy, dx, cost in NEIGHBORS:
+            allowed = passable & self.shifted(passable, dy, dx, False)
+            if dy and dx:
+                allowed &= self.shifted(passable, dy, 0, False) & self.shifted(passable, 0, dx, False)
+            steps.append((dy, dx, cost, allowed))
+
+        cells = np.where(passable, cells, np.inf)
+        while True:
+            relaxed = cells.copy()
+            for dy, dx, cost, allowed in steps:
+                through = np.where(allowed, self.shifted(cells, dy, dx, np.inf) + cost, np.inf)
+                np.minimum(relaxed, through, out=relaxed)
+            if np.array_equal(relaxed, cells):
+                return cells
+            cells = relaxed
+
+    def descent(self, cells):
+        """Unit heading down the distance field (upwind differences on each axis)"""
+        heading = np.zeros(cells.shape + (2,))
+        reachable = np.isfinite(cells)
+        for axis, (dy, dx) in enumerate(((0, 1), (1, 0))):
+            # Distance saved by a step forward or backward along the axis
+            with np.errstate(invalid="ignore"):
+                forward = cells - self.shifted(cells, dy, dx, np.inf)
+                backward = cells - self.shifted(cells, -dy, -dx, np.inf)
+            forward = np.where(reachable, forward, 0.0)
+            backward = np.where(reachable, backward, 0.0)
+            heading[..., axis] = np.where((forward >= backward) & (forward > 0), forward,
+                                          np.where(backward > 0, -backward, 0.0))
+        length = np.hypot(heading[..., 0], heading[..., 1])
+        return heading / np.where(length > 0, length, 1.0)[..., None]
+
+    def lookup(self, positions):
+        """Path lengths (N, max_exits) and headings (N, max_exits, 2) at positions (N, 2)"""
+        grid_x, grid_y = self.map.cell_indices(np.asarray(positions, dtype=float))
+        grid_x = np.clip(grid_x, 0, self.shape[1] - 1)
+        grid_y = np.clip(grid_y, 0, self.shape[0] - 1)
+        return self.distance[:, grid_y, grid_x].T, self.direction[:, grid_y, grid_x].transpose(1, 0, 2)
@@ -1,20 +1,28 @@
-import pygame
+import argparse
+import os
 import numpy as np
 import matplotlib.pyplot as plt
-from simulation import SimulationRecorder
-from config import WIDTH, HEIGHT, NUM_BOIDS, ROOMS
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from model import EvacuationModel
+from layouts import use_layout
+from config import WIDTH, HEIGHT, ROOMS, CROWD_FIELD
 import time
 import csv
 from datetime import datetime
 
-class HeatmapSimulation(SimulationRecorder):
-    def __init__(self, resolution=(200, 125)):
-        super().__init__()
+class HeatmapSimulation(EvacuationModel):
+    def __init__(self, resolution=(200, 125), seed=None, crowd_field=CROWD_FIELD):
+        super().__init__(seed=seed, crowd_field=crowd_field)
         self.resolution = resolution
         self.heatmap = np.zeros((resolution[1], resolution[0]))
         self.scale_x = (resolution[0] - 1) / WIDTH
         self.scale_y = (resolution[1] - 1) / HEIGHT
         self.start_time = None
+        if self.crowd is not None:
+            # Heatmap cell of the center of each crowd cell, to add the density there
+            centers_x = np.minimum((self.crowd.centers_x * self.scale_x).astype(int), resolution[0] - 1)
+            centers_y = np.minimum((self.crowd.centers_y * self.scale_y).astype(int), resolution[1] - 1)
+            self.crowd_cells = (centers_y * resolution[0] + centers_x).ravel()
         
     def get_heatmap_position(self, x, y):
         x = max(0, min(x, WIDTH))
@@ -26,38 +34,37 @@ class HeatmapSimulation(SimulationRecorder):
         return heatmap_x, heatmap_y
         
     def update(self):
-        if not self.paused:
-            super().update()
-            for boid in self.boids:
-                if boid.is_alive:
-                    try:
-                        x, y = self.get_heatmap_position(boid.position[0], boid.position[1])
-                        self.heatmap[y, x] += 1
-                    except IndexError as e:
-                        print(f"Position error: orig_pos={boid.position}, scaled_pos=({x}, {y})")
-                        print(f"Heatmap shape: {self.heatmap.shape}")
-                        continue
+        super().update()
+        for position in self.alive_boid_positions():
+            try:
+                x, y = self.get_heatmap_position(position[0], position[1])
+                self.heatmap[y, x] += 1
+            except IndexError as e:
+                print(f"Position error: orig_pos={position}, scaled_pos=({x}, {y})")
+                print(f"Heatmap shape: {self.heatmap.shape}")
+                continue
+        if self.crowd is not None:
+            # Occupants of the crowd field count like boids, spread by their density
+            self.heatmap += np.bincount(self.crowd_cells, weights=self.crowd.density.ravel(),
+                                        minlength=self.heatmap.size).reshape(self.heatmap.shape)
     
     def run_with_timeout(self, timeout_seconds=240):
-        running = True
+        # Headless: no window, no rendering, no frame cap
         self.start_time = time.time()
         
         try:
-            while running:
+            while True:
                 current_time = time.time() - self.start_time
                 if current_time > timeout_seconds:
                     print(f"Simulation timed out after {current_time:.1f} seconds")
                     break
                 
-                if len(self.boids) == 0 or (self.escaped_boids + self.dead_boids) >= NUM_BOIDS:
+                if self.is_finished():
                     print(f"Simulation completed naturally after {current_time:.1f} seconds")
                     print(f"Escaped: {self.escaped_boids}, Dead: {self.dead_boids}")
                     break
                 
-                running = self.handle_events()
                 self.update()
-                self.draw()
-                #self.clock.tick(60)
                 
         except Exception as e:
             print(f"Simulation error: {str(e)}")
@@ -71,11 +78,50 @@ class HeatmapSimulation(SimulationRecorder):
             'time': time.time() - self.start_time
         }
 
+def run_simulation(run, seed, resolution, max_time, crowd_field=CROWD_FIELD):
+    """Runs one simulation; executed in a worker process by create_heatmap"""
+    print(f"\nStarting simulation {run + 1} (seed {seed})")
+    sim = HeatmapSimulation(resolution, seed=seed, crowd_field=crowd_field)
+    result = sim.run_with_timeout(max_time)
+    result['run'] = run
+    result['seed'] = seed
+    return result
+
+def run_simulations(seeds, resolution, max_time, workers, layout=None, crowd_field=CROWD_FIELD):
+    """Yields (run, seed, result or exception) as soon as each run finishes"""
+    if layout:
+        use_layout(layout)
+    if workers == 1:
+        for run, seed in enumerate(seeds):
+            try:
+                yield run, seed, run_simulation(run, seed, resolution, max_time, crowd_field)
+            except Exception as e:
+                yield run, seed, e
+        return
+
+    # Fill the layout cache once, so that the workers map it instead of each computing it
+    EvacuationModel(num_boids=0, crowd_field=crowd_field)
+    with ProcessPoolExecutor(max_workers=workers, initializer=use_layout if layout else None,
+                             initargs=(layout,)) as executor:
+        futures = {executor.submit(run_simulation, run, seed, resolution, max_time, crowd_field): (run, seed)
+                   for run, seed in enumerate(seeds)}
+        for future in as_completed(futures):
+            run, seed = futures[future]
+            try:
+                yield run, seed, future.result()
+            except Exception as e:
+                yield run, seed, e
+
 def create_heatmap(resolution=(200, 125), num_runs=20, max_time=240, 
-                  heatmap_output='heatmap_multi.png', stats_output='simulation_stats.csv'):
+                  heatmap_output='heatmap_multi.png', stats_output='simulation_stats.csv',
+                  workers=None, seed=None, layout=None, crowd_field=CROWD_FIELD):
     accumulated_heatmap = np.zeros((resolution[1], resolution[0]))
     completed_runs = 0
     successful_runs = 0
+
+    # One independent seed per run, derived from the base seed
+    seeds = [int(s.generate_state(1)[0]) for s in np.random.SeedSequence(seed).spawn(num_runs)]
+    workers = workers or os.cpu_count() or 1
     
     # Prepare stats file
     timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
@@ -83,42 +129,40 @@ def create_heatmap(resolution=(200, 125), num_runs=20, max_time=240,
     
     with open(stats_output, 'w', newline='') as csvfile:
         writer = csv.writer(csvfile)
-        writer.writerow(['Run', 'Escaped Boids', 'Dead Boids', 'Survival Rate (%)', 
+        writer.writerow(['Run', 'Seed', 'Escaped Boids', 'Dead Boids', 'Survival Rate (%)', 
                         'Simulation Time (s)', 'Status'])
         
-        for run in range(num_runs):
-            print(f"\nStarting simulation {run + 1}/{num_runs}")
-            try:
-                sim = HeatmapSimulation(resolution)
-                result = sim.run_with_timeout(max_time)
-                
-                if result['heatmap'] is not None:
-                    accumulated_heatmap += result['heatmap']
-                    successful_runs += 1
-                    
-                    # Calculate survival rate
-                    total_boids = result['escaped'] + result['dead']
-                    survival_rate = (result['escaped'] / total_boids * 100) if total_boids > 0 else 0
-                    
-                    # Write stats to CSV
-                    writer.writerow([
-                        run + 1,
-                        result['escaped'],
-                        result['dead'],
-                        f"{survival_rate:.2f}",
-                        f"{result['time']:.1f}",
-                        "Completed"
-                    ])
-                    csvfile.flush()  # Ensure data is written immediately
+        # Results arrive in completion order; each one is aggregated and written immediately
+        for run, seed, result in run_simulations(seeds, resolution, max_time, min(workers, num_runs), layout,
+                                                 crowd_field):
+            if isinstance(result, Exception):
+                print(f"Run {run + 1} failed: {str(result)}")
+                writer.writerow([run + 1, seed, 'N/A', 'N/A', 'N/A', 'N/A', f"Failed: {str(result)}"])
+                csvfile.flush()
+                continue
+
+            if result['heatmap'] is not None:
+                accumulated_heatmap += result['heatmap']
+                successful_runs += 1
                 
-                completed_runs += 1
+                # Calculate survival rate
+                total_boids = result['escaped'] + result['dead']
+                survival_rate = (result['escaped'] / total_boids * 100) if total_boids > 0 else 0
                 
-            except Exception as e:
-                print(f"Run {run + 1} failed: {str(e)}")
-                writer.writerow([run + 1, 'N/A', 'N/A', 'N/A', 'N/A', f"Failed: {str(e)}"])
-                csvfile.flush()
-            finally:
-                pygame.quit()
+                # Write stats to CSV
+                writer.writerow([
+                    run + 1,
+                    seed,
+                    result['escaped'],
+                    result['dead'],
+                    f"{survival_rate:.2f}",
+                    f"{result['time']:.1f}",
+                    "Completed"
+                ])
+                csvfile.flush()  # Ensure data is written immediately
+            
+            completed_runs += 1
+            print(f"Finished {completed_runs}/{num_runs} runs")
         
         # Write summary statistics
         if successful_runs > 0:
@@ -168,5 +212,24 @@ def create_heatmap(resolution=(200, 125), num_runs=20, max_time=240,
     else:
         print("No successful simulations completed")
 
+def parse_args():
+    parser = argparse.ArgumentParser(description='Average boid occupancy over many headless simulations')
+    parser.add_argument('--runs', '-n', type=int, default=20,
+                      help='Number of simulations (default: 20)')
+    parser.add_argument('--workers', '-w', type=int,
+                      help='Worker processes (default: number of CPUs, 1 runs in-process)')
+    parser.add_argument('--seed', type=int,
+                      help='Base seed; each run gets its own seed derived from it')
+    parser.add_argument('--max-time', type=float, default=240,
+                      help='Wall-clock limit per run in seconds (default: 240)')
+    parser.add_argument('--layout', type=str, metavar='FILE',
+                      help='Building to evacuate, as a layout file (default: the building of config.py)')
+    parser.add_argument('--crowd-field', action='store_true',
+                      help='Move occupants away from the smoke as a continuous crowd (counted in the heatmap by density)')
+    return parser.parse_args()
+
 if __name__ == "__main__":
-    create_heatmap(resolution=(250, 156))
\ No newline at end of file
+    args = parse_args()
+    create_heatmap(resolution=(250, 156), num_runs=args.runs, max_time=args.max_time,
+                   workers=args.workers, seed=args.seed, layout=args.layout,
+                   crowd_field=args.crowd_field or CROWD_FIELD)
\ No newline at end of file
@@ -0,0 +1,186 @@
+import argparse
+import hashlib
+import json
+import os
+import numpy as np
+import pygame
+from config import *
+
+# Bumped whenever the arrays derived from a layout are computed differently
+LAYOUT_CACHE_VERSION = 1
+
+
+def build_walls(rooms, obstacles, thickness=WALL_THICKNESS):
+    """Walls of every room (top, bottom, left, right) followed by the obstacles, as in config.py"""
+    walls = []
+    for room in rooms.values():
+        x, y, w, h = room["bounds"]
+        walls.extend([
+            pygame.Rect(x, y, w, thickness),
+            pygame.Rect(x, y + h, w, thickness),
+            pygame.Rect(x, y, thickness, h),
+            pygame.Rect(x + w, y, thickness, h),
+        ])
+    walls.extend(obstacles)
+    return walls
+
+
+def load_layout(path):
+    """Read a building file (JSON, see layouts/default.json).
+
+    Returns {"rooms", "walls", "obstacles", "exit_processing_time"} in the
+    same form as the config.py globals.
+    """
+    with open(path) as f:
+        data = json.load(f)
+    if data.get("version") != 1:
+        raise ValueError(f"Unsupported layout version {data.get('version')} in {path}")
+
+    rooms = {}
+    for room_id, room in data["rooms"].items():
+        exits = []
+        for exit_info in room["exits"]:
+            spawn_point = exit_info.get("spawn_point")
+            exits.append({
+                "id": int(exit_info["id"]),
+                "to_room": exit_info.get("to_room"),
+                "position": tuple(exit_info["position"]),
+                "spawn_point": tuple(spawn_point) if spawn_point else None,
+                "direction": tuple(exit_info["direction"]),
+                "flow_rate": exit_info["flow_rate"],
+                "width": exit_info["width"],
+            })
+        rooms[int(room_id)] = {"bounds": tuple(room["bounds"]), "spawn_area": tuple(room["spawn_area"]),
+                               "exits": exits}
+
+    for room_id, room in rooms.items():
+        x, y, w, h = room["bounds"]
+        if x < 0 or y < 0 or x + w > WIDTH or y + h > HEIGHT:
+            raise ValueError(f"Room {room_id} of {path} does not fit in {WIDTH}x{HEIGHT}")
+        for exit_info in room["exits"]:
+            if exit_info["to_room"] is not None and exit_info["to_room"] not in rooms:
+                raise ValueError(f"Exit {exit_info['id']} of {path} leads to unknown room {exit_info['to_room']}")
+
+    obstacles = [pygame.Rect(*rect) for rect in data.get("obstacles", [])]
+    walls = build_walls(rooms, obstacles, data.get("wall_thickness", WALL_THICKNESS))
+    walls.extend(pygame.Rect(*rect) for rect in data.get("extra_walls", []))
+    processing = {int(exit_id): time for exit_id, time in data.get("exit_processing_time", {}).items()}
+    for room in rooms.values():
+        for exit_info in room["exits"]:
+            processing.setdefault(exit_info["id"], 500)
+    return {"rooms": rooms, "walls": walls, "obstacles": obstacles, "exit_processing_time": processing}
+
+
+def use_layout(path):
+    """Switch every module to the building in path.
+
+    The config.py globals are updated in place, so the modules that imported
+    them with `from config import *` see the new layout. Models created
+    afterwards use it; existing ones keep their already built grids.
+    """
+    layout = load_layout(path)
+    ROOMS.clear()
+    ROOMS.update(layout["rooms"])
+    WALLS[:] = layout["walls"]
+    OBSTACLES[:] = layout["obstacles"]
+    EXIT_PROCESSING_TIME.clear()
+    EXIT_PROCESSING_TIME.update(layout["exit_processing_time"])
+    return layout
+
+
+def export_layout(path):
+    """Write the current config.py building as a layout file"""
+    room_walls = 4 * len(ROOMS)
+    data = {
+        "version": 1,
+        "wall_thickness": WALL_THICKNESS,
+        "rooms": {str(room_id): room for room_id, room in ROOMS.items()},
+        "obstacles": [list(rect) for rect in OBSTACLES],
+        "extra_walls": [list(rect) for rect in WALLS[room_walls:len(WALLS) - len(OBSTACLES)]],
+        "exit_processing_time": {str(exit_id): time for exit_id, time in EXIT_PROCESSING_TIME.items()},
+    }
+    with open(path, "w") as f:
+        json.dump(data, f, indent=2)
+
+
+def layout_key(walls, rooms):
+    """Content hash of a floor plan and of the settings its derived grids depend on"""
+    content = json.dumps({
+        "version": LAYOUT_CACHE_VERSION,
+        "size": [WIDTH, HEIGHT],
+        "wall_detection_distance": WALL_DETECTION_DISTANCE,
+        "walls": [list(wall) for wall in walls],
+        "rooms": {str(room_id): room for room_id, room in rooms.items()},
+    }, sort_keys=True)
+    return hashlib.sha256(content.encode()).hexdigest()[:32]
+
+
+class LayoutCache:
+    """Grids derived from a floor plan, computed once and kept on disk.
+
+    Each layout gets a directory named after layout_key(); every grid is one
+    .npy file in it, loaded read-only with mmap_mode so that startup does not
+    read more than the pages it touches. Grids are written to a temporary
+    file and renamed, so processes sharing the cache never see half a file.
+    """
+
+    def __init__(self, directory=LAYOUT_CACHE_DIR, enabled=LAYOUT_CACHE):
+        self.directory = directory
+        self.enabled = enabled
+        self.loaded = {}
+
+    def get(self, key, names, build):
+        """Arrays names of layout key, computed by build() (returning {name: array}) if missing"""
+        if not self.enabled:
+            return build()
+        folder = os.path.join(self.directory, key)
+        arrays = {}
+        try:
+            for name in names:
+                if (key, name) not in self.loaded:
+                    self.loaded[key, name] = np.load(os.path.join(folder, name + ".npy"), mmap_mode="r")
+                arrays[name] = self.loaded[key, name]
+            return arrays
+        except (OSError, ValueError):
+            pass
+
+        arrays = build()
+        os.makedirs(folder, exist_ok=True)
+        for name, array in arrays.items():
+            path = os.path.join(folder, name + ".npy")
+            temporary = f"{path}.{os.getpid()}.tmp"
+            with open(temporary, "wb") as f:
+                np.save(f, np.asarray(array))
+            os.replace(temporary, path)
+        return arrays
+
+
+layout_cache = LayoutCache()
+
+
+def compile_layouts(paths):
+    """Fill the cache for each layout file, so that later runs start from it"""
+    from model import EvacuationModel
+
+    for path in paths:
+        use_layout(path)
+        model = EvacuationModel(num_boids=0, crowd_field=True)
+        print(f"{path}: {layout_key(model.map.walls, model.map.rooms)}")
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Export or precompile building layouts')
+    commands = parser.add_subparsers(dest='command', required=True)
+    export = commands.add_parser('export', help='Write the config.py building as a layout file')
+    export.add_argument('path', type=str)
+    compile_ = commands.add_parser('compile', help='Fill the layout cache for layout files')
+    compile_.add_argument('paths', type=str, nargs='+')
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    if args.command == 'export':
+        export_layout(args.path)
+    else:
+        compile_layouts(args.paths)
@@ -1,6 +1,7 @@
 # main.py
 import argparse
-from simulation import SimulationRecorder
+from config import TIME_STEP, NUM_BOIDS, CROWD_FIELD, FLOCKING_MODE, DIRTY_RECT_RENDERING, VIDEO_DROP_FRAMES
+from profiling import profiler
 
 def parse_args():
     parser = argparse.ArgumentParser(description='Run Boids simulation with optional video recording')
@@ -12,20 +13,129 @@ def parse_args():
                       help='Recording framerate (default: 30)')
     parser.add_argument('--duration', '-d', type=int,
                       help='Recording duration in seconds (optional)')
-    return parser.parse_args()
+    parser.add_argument('--frame-skip', type=int, default=1,
+                      help='Record one displayed frame out of N (default: 1; the display runs at '
+                           '60 fps, so --fps 30 --frame-skip 2 plays back in real time)')
+    parser.add_argument('--drop-frames', action='store_true',
+                      help='Drop frames when the video encoder falls behind instead of waiting for it')
+    parser.add_argument('--speed', type=int, default=1,
+                      help='Simulation steps per displayed frame (default: 1, i.e. real time; '
+                           '+/- change it while running)')
+    parser.add_argument('--fast-forward', action='store_true',
+                      help='Keep rendering at FAST_FORWARD_FPS and spend the rest of each frame on '
+                           'simulation steps (F toggles it)')
+    parser.add_argument('--dirty-rects', action='store_true',
+                      help='Only redraw the screen regions that change between frames')
+    parser.add_argument('--profile', nargs='?', const='profile.json', metavar='PATH',
+                      help='Time each simulation phase, show the averages on screen and save '
+                           'every frame to PATH (.json or .csv, default: profile.json)')
+    parser.add_argument('--boids', type=int, default=NUM_BOIDS,
+                      help=f'Number of occupants (default: {NUM_BOIDS})')
+    parser.add_argument('--crowd-field', action='store_true',
+                      help='Simulate occupants away from the smoke as a continuous crowd, for very large --boids')
+    parser.add_argument('--flocking', choices=['exact', 'grid'], default=FLOCKING_MODE,
+                      help='Alignment and cohesion from every visible neighbor (exact) or from per-cell '
+                           'sums on a grid, much faster for dense crowds (grid) (default: %(default)s)')
+    parser.add_argument('--seed', type=int,
+                      help='Seed the random generators for a reproducible run (with --resume: reseed the '
+                           'branch so that runs from one checkpoint diverge)')
+    parser.add_argument('--resume', type=str, metavar='CHECKPOINT',
+                      help='Start from a checkpoint saved with --save-checkpoint (its occupants, crowd and '
+                           'flocking settings replace --boids, --crowd-field and --flocking)')
+    parser.add_argument('--save-checkpoint', type=str, metavar='PATH',
+                      help='Save the full simulation state to PATH (.npz) when the run ends')
+    parser.add_argument('--trajectory', type=str, metavar='DIR',
+                      help='Record the boids of every step (and the smoke every few steps) into DIR '
+                           'for offline analysis or replay')
+    parser.add_argument('--layout', type=str, metavar='FILE',
+                      help='Building to evacuate, as a layout file (see layouts/default.json; '
+                           'default: the building of config.py)')
+    parser.add_argument('--no-layout-cache', action='store_true',
+                      help='Recompute the grids derived from the building instead of loading them '
+                           'from the layout cache')
+    parser.add_argument('--headless', action='store_true',
+                      help='Run without display at full speed and print the final statistics '
+                           '(--duration is then in simulated seconds)')
+    args = parser.parse_args()
+    if args.headless and args.record:
+        parser.error('--record needs a display and cannot be combined with --headless')
+    return args
+
+def run_headless(duration=None, num_boids=NUM_BOIDS, crowd_field=CROWD_FIELD, flocking=FLOCKING_MODE,
+                 seed=None, resume=None, save_checkpoint=None, trajectory=None):
+    from model import EvacuationModel
+    import checkpoint
+
+    if resume:
+        model = checkpoint.load_checkpoint(resume, seed=seed)
+    else:
+        model = EvacuationModel(num_boids=num_boids, seed=seed, crowd_field=crowd_field, flocking=flocking)
+    if trajectory:
+        model.start_trajectory(trajectory)
+    # The duration counts from the checkpoint when resuming
+    max_steps = model.step_count + int(round(duration / TIME_STEP)) if duration else None
+    while not model.is_finished() and (max_steps is None or model.step_count < max_steps):
+        model.update()
+        # Headless, a profiled frame is one simulation step
+        profiler.end_frame()
+    model.stop_trajectory()
+
+    stats = model.statistics()
+    print(f"Time: {stats['time']:.1f}s ({stats['steps']} steps)")
+    print(f"Active Boids: {stats['active']}")
+    print(f"Escaped Boids: {stats['escaped']}")
+    print(f"Dead Boids: {stats['dead']}")
+    print(f"Survival Rate: {stats['survival_rate']:.1f}%")
+
+    if save_checkpoint:
+        checkpoint.save_checkpoint(model, save_checkpoint)
+        print(f"Checkpoint saved as {save_checkpoint}")
 
 if __name__ == "__main__":
     args = parse_args()
-    sim = SimulationRecorder(record_fps=args.fps)
-    
-    if args.record:
-        sim.start_recording(args.output)
-        
-        if args.duration:
-            # Si une durée est spécifiée, on lance la simulation pour cette durée
-            sim.run(max_frames=args.duration * args.fps)
+    if args.profile:
+        profiler.enable()
+    if args.no_layout_cache:
+        from layouts import layout_cache
+        layout_cache.enabled = False
+    if args.layout:
+        from layouts import use_layout
+        use_layout(args.layout)
+
+    if args.headless:
+        run_headless(args.duration, args.boids, args.crowd_field or CROWD_FIELD, args.flocking,
+                     args.seed, args.resume, args.save_checkpoint, args.trajectory)
+    else:
+        from simulation import SimulationRecorder
+        import checkpoint
+        options = dict(record_fps=args.fps, dirty_rects=args.dirty_rects or DIRTY_RECT_RENDERING,
+                       frame_skip=args.frame_skip, drop_frames=args.drop_frames or VIDEO_DROP_FRAMES,
+                       steps_per_frame=args.speed, fast_forward=args.fast_forward)
+        if args.resume:
+            sim = checkpoint.load_checkpoint(args.resume, SimulationRecorder, seed=args.seed, **options)
+        else:
+            sim = SimulationRecorder(num_boids=args.boids, seed=args.seed,
+                                     crowd_field=args.crowd_field or CROWD_FIELD, flocking=args.flocking,
+                                     **options)
+        if args.trajectory:
+            sim.start_trajectory(args.trajectory)
+
+        if args.record:
+            sim.start_recording(args.output)
+
+            if args.duration:
+                # Si une durée est spécifiée, on lance la simulation pour cette durée
+                sim.run(max_frames=args.duration * args.fps * args.frame_skip)
+            else:
+                # Sinon, on lance la simulation normalement
+                sim.run()
         else:
-            # Sinon, on lance la simulation normalement
             sim.run()
-    else:
-        sim.run()
\ No newline at end of file
+        sim.stop_trajectory()
+
+        if args.save_checkpoint:
+            checkpoint.save_checkpoint(sim, args.save_checkpoint)
+            print(f"Checkpoint saved as {args.save_checkpoint}")
+
+    if args.profile:
+        profiler.export(args.profile)
\ No newline at end of file
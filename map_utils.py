@@ -1,36 +1,90 @@
+import math
+import numpy as np
 import pygame
 from config import *
+from profiling import profiler
+from layouts import layout_cache, layout_key
+from flow_field import FlowField
 
 class Map:
-    def __init__(self):
+    # Fixed perception pattern used by the boids: 8 directions on 3 circles
+    PROBE_RADII = (SMOKE_AVOIDANCE_RADIUS * 1.5, SMOKE_AVOIDANCE_RADIUS, SMOKE_AVOIDANCE_RADIUS * 0.5)
+    PROBE_DIRECTIONS = 8
+
+    def __init__(self, render_only=False):
         self.walls = WALLS
         self.rooms = ROOMS
         # Grid size matching the smoke simulation grid
         self.grid_size = 4  # Since FireManager uses WIDTH // 4
-        self.init_wall_grid()
+        # render_only skips the collision and wall-force grids (replays only draw the map)
+        self.render_only = render_only
+        if not render_only:
+            self.init_wall_grid()
+            self.init_probe_cache()
+            self.init_flow_field()
+        # Cached rendering of the building (background, rooms, exits, walls)
+        self.static_layer = None
+
+    def invalidate_static_layer(self):
+        self.static_layer = None
 
     def is_line_of_sight_clear(self, start_pos, end_pos):
-        """Vérifie si la ligne de vue entre deux points est dégagée"""
-        # Nombre de points à vérifier sur la ligne
-        num_points = 10
-        
-        # Vérifier plusieurs points le long de la ligne
-        for i in range(num_points):
-            t = i / (num_points - 1)
-            check_x = start_pos.x + (end_pos.x - start_pos.x) * t
-            check_y = start_pos.y + (end_pos.y - start_pos.y) * t
-            
-            # Si un point est dans un mur, la ligne de vue est bloquée
-            if self.is_point_in_wall(pygame.Vector2(check_x, check_y)):
+        """Vérifie si la ligne de vue entre deux points est dégagée.
+
+        Parcourt (DDA) chaque cellule traversée par le segment dans le masque de
+        collision et s'arrête au premier mur rencontré.
+        """
+        profiler.count("rays_cast")
+        # Coordonnées en cellules du masque de collision (décalé d'une cellule)
+        start_x = start_pos.x / self.grid_size + 1
+        start_y = start_pos.y / self.grid_size + 1
+        dir_x = end_pos.x / self.grid_size + 1 - start_x
+        dir_y = end_pos.y / self.grid_size + 1 - start_y
+        cell_x, cell_y = math.floor(start_x), math.floor(start_y)
+        remaining = (abs(math.floor(start_x + dir_x) - cell_x) +
+                     abs(math.floor(start_y + dir_y) - cell_y))
+
+        step_x = 1 if dir_x > 0 else -1
+        step_y = 1 if dir_y > 0 else -1
+        delta_x = abs(1 / dir_x) if dir_x else math.inf
+        delta_y = abs(1 / dir_y) if dir_y else math.inf
+        t_max_x = ((cell_x + 1 - start_x) if dir_x > 0 else (start_x - cell_x)) * delta_x if dir_x else math.inf
+        t_max_y = ((cell_y + 1 - start_y) if dir_y > 0 else (start_y - cell_y)) * delta_y if dir_y else math.inf
+
+        height, width = self.collision_mask.shape
+        while True:
+            # Si une cellule traversée est dans un mur, la ligne de vue est bloquée
+            if 0 <= cell_x < width and 0 <= cell_y < height and self.collision_mask[cell_y, cell_x]:
                 return False
-                
-        return True
+            if remaining == 0:
+                return True
+            if t_max_x < t_max_y:
+                cell_x += step_x
+                t_max_x += delta_x
+            else:
+                cell_y += step_y
+                t_max_y += delta_y
+            remaining -= 1
+
+    # Grids derived from the walls, stored in the layout cache
+    WALL_GRIDS = ("wall_grid", "collision_mask", "wall_avoidance_field")
 
     def init_wall_grid(self):
-        """Initialize wall grid aligned with smoke grid"""
+        """Load the wall grid and its collision and avoidance fields from the layout cache"""
         self.grid_width = WIDTH // self.grid_size
         self.grid_height = HEIGHT // self.grid_size
-        self.wall_grid = [[False for x in range(self.grid_width)] for y in range(self.grid_height)]
+        self.layout_key = layout_key(self.walls, self.rooms)
+        grids = layout_cache.get(self.layout_key, self.WALL_GRIDS, self.compile_wall_grids)
+        for name in self.WALL_GRIDS:
+            setattr(self, name, grids[name])
+
+    def init_flow_field(self):
+        """Shortest paths to the exits of each room, None with straight-line exit steering"""
+        self.flow_field = FlowField(self) if FLOW_FIELD else None
+
+    def compile_wall_grids(self):
+        """Initialize wall grid aligned with smoke grid, plus the precomputed collision and avoidance fields"""
+        self.wall_grid = np.zeros((self.grid_height, self.grid_width), dtype=bool)
         
         # Convert walls to grid
         for wall in self.walls:
@@ -38,12 +92,71 @@ class Map:
             grid_right = min(self.grid_width - 1, (wall.right // self.grid_size) + 1)
             grid_top = max(0, wall.top // self.grid_size)
             grid_bottom = min(self.grid_height - 1, (wall.bottom // self.grid_size) + 1)
-            
-            for y in range(grid_top, grid_bottom):
-                for x in range(grid_left, grid_right):
-                    self.wall_grid[y][x] = True
+            self.wall_grid[grid_top:grid_bottom, grid_left:grid_right] = True
+
+        self.init_collision_mask()
+        self.init_wall_field()
+        return {name: getattr(self, name) for name in self.WALL_GRIDS}
+
+    def init_collision_mask(self):
+        """Wall grid dilated by the one-cell margin used by is_point_in_wall.
 
-    def draw(self, screen):
+        The mask is padded by one cell on each side so that points just outside
+        the grid still see the walls on its border.
+        """
+        self.collision_mask = self.dilate(np.pad(self.wall_grid, 1), 1)
+
+    def init_wall_field(self):
+        """Precompute the wall avoidance force at every cell center"""
+        cell_y, cell_x = np.mgrid[0:self.grid_height, 0:self.grid_width]
+        centers = np.column_stack(((cell_x.ravel() + 0.5) * self.grid_size,
+                                   (cell_y.ravel() + 0.5) * self.grid_size))
+
+        avoidance = np.zeros_like(centers)
+
+        # Only cells with a wall in their scan window can feel a force
+        reach = self.dilate(self.wall_grid, WALL_DETECTION_DISTANCE // self.grid_size).ravel()
+        cells = np.flatnonzero(reach)
+        chunk = 8192
+        for start in range(0, len(cells), chunk):
+            block = cells[start:start + chunk]
+            avoidance[block] = self.compute_wall_avoidance_forces(centers[block])
+
+        self.wall_avoidance_field = avoidance.reshape(self.grid_height, self.grid_width, 2)
+
+    def dilate(self, mask, radius):
+        """Square dilation of a boolean grid by radius cells"""
+        height, width = mask.shape
+        padded = np.pad(mask, radius)
+        result = np.zeros_like(mask)
+        for dy in range(2 * radius + 1):
+            for dx in range(2 * radius + 1):
+                result |= padded[dy:dy + height, dx:dx + width]
+        return result
+
+    def cell_indices(self, points):
+        grid_x = np.floor(points[..., 0] / self.grid_size).astype(np.int64)
+        grid_y = np.floor(points[..., 1] / self.grid_size).astype(np.int64)
+        return grid_x, grid_y
+
+    def get_static_layer(self):
+        if self.static_layer is None:
+            layer = pygame.Surface((WIDTH, HEIGHT))
+            if pygame.display.get_surface() is not None:
+                layer = layer.convert()
+            layer.fill(BACKGROUND_COLOR)
+            self.draw_layout(layer)
+            self.static_layer = layer
+        return self.static_layer
+
+    def draw(self, screen, area=None):
+        """Blit the cached building layer, on the whole screen or only on area"""
+        if area is None:
+            screen.blit(self.get_static_layer(), (0, 0))
+        else:
+            screen.blit(self.get_static_layer(), area, area)
+
+    def draw_layout(self, screen):
         # Draw rooms
         for room_id, room in self.rooms.items():
             bounds = room["bounds"]
@@ -60,69 +173,165 @@ class Map:
             pygame.draw.rect(screen, WALL_COLOR, wall)
 
     def is_point_in_wall(self, point):
-        """Check if a point is inside any wall using the grid"""
-        grid_x = int(point.x // self.grid_size)
-        grid_y = int(point.y // self.grid_size)
-        
-        # Add a small margin to prevent boids from getting too close to walls
-        margin = 1
-        for dy in range(-margin, margin + 1):
-            for dx in range(-margin, margin + 1):
-                check_x = grid_x + dx
-                check_y = grid_y + dy
-                if (0 <= check_x < self.grid_width and 
-                    0 <= check_y < self.grid_height and 
-                    self.wall_grid[check_y][check_x]):
-                    return True
+        """Check if a point is inside any wall (with a one-cell margin) using the collision mask"""
+        grid_x = int(point.x // self.grid_size) + 1
+        grid_y = int(point.y // self.grid_size) + 1
+        if 0 <= grid_x < self.grid_width + 2 and 0 <= grid_y < self.grid_height + 2:
+            return bool(self.collision_mask[grid_y, grid_x])
         return False
 
     def get_wall_avoidance_force(self, position):
-            """Calculate the force to avoid walls using the grid and handle sliding"""
-            avoidance = pygame.Vector2(0, 0)
-            grid_x = int(position.x // self.grid_size)
-            grid_y = int(position.y // self.grid_size)
-            
-            check_radius = WALL_DETECTION_DISTANCE // self.grid_size
-            pos = pygame.Vector2(position)
-            
-            # Calculer la normale moyenne des murs proches
-            wall_normal = pygame.Vector2(0, 0)
-            wall_count = 0
-            
-            for dy in range(-check_radius, check_radius + 1):
-                for dx in range(-check_radius, check_radius + 1):
-                    check_x = grid_x + dx
-                    check_y = grid_y + dy
-                    
-                    if (0 <= check_x < self.grid_width and 
-                        0 <= check_y < self.grid_height and 
-                        self.wall_grid[check_y][check_x]):
-                        
-                        wall_center = pygame.Vector2(
-                            (check_x + 0.5) * self.grid_size,
-                            (check_y + 0.5) * self.grid_size
-                        )
-                        
-                        distance = pos.distance_to(wall_center)
-                        if 0 < distance < WALL_DETECTION_DISTANCE:
-                            # Calculer la normale du mur
-                            normal = (pos - wall_center).normalize()
-                            wall_normal += normal
-                            wall_count += 1
-                            
-                            # Force d'évitement diminuant avec la distance
-                            force = normal * (1 - distance / WALL_DETECTION_DISTANCE)
-                            avoidance += force
-            
-            if wall_count > 0:
-                # Normaliser la normale moyenne
-                wall_normal = wall_normal / wall_count
-                wall_normal.normalize_ip()
-                
-                # Ajuster la force d'évitement pour favoriser le glissement
-                # en réduisant la composante parallèle au mur
-                parallel = pygame.Vector2(-wall_normal.y, wall_normal.x)
-                avoidance = (avoidance.dot(wall_normal) * wall_normal * 1.5 + 
-                            avoidance.dot(parallel) * parallel * 0.5)
-            
-            return avoidance
\ No newline at end of file
+        """Wall avoidance force (with sliding) read from the precomputed field"""
+        force = self.get_wall_avoidance_forces(np.array([[position.x, position.y]]))[0]
+        return pygame.Vector2(force[0], force[1])
+
+    def are_points_in_walls(self, points):
+        """Vectorized is_point_in_wall for an array of points (..., 2)"""
+        grid_x, grid_y = self.cell_indices(np.asarray(points, dtype=float))
+        grid_x += 1
+        grid_y += 1
+        inside = ((grid_x >= 0) & (grid_x < self.grid_width + 2) &
+                  (grid_y >= 0) & (grid_y < self.grid_height + 2))
+        return inside & self.collision_mask[np.where(inside, grid_y, 0), np.where(inside, grid_x, 0)]
+
+    def are_lines_of_sight_clear(self, start_points, end_points):
+        """Vectorized is_line_of_sight_clear for arrays of segments (..., 2).
+
+        All rays advance one cell per iteration; a ray leaves the active set as
+        soon as it reaches a wall or its last cell.
+        """
+        shape = np.shape(start_points)[:-1]
+        profiler.count("rays_cast", int(np.prod(shape)))
+        start = np.asarray(start_points, dtype=float).reshape(-1, 2) / self.grid_size + 1
+        direction = np.asarray(end_points, dtype=float).reshape(-1, 2) / self.grid_size + 1 - start
+
+        cell = np.floor(start).astype(np.int64)
+        remaining = np.abs(np.floor(start + direction).astype(np.int64) - cell).sum(axis=1)
+        step = np.where(direction > 0, 1, -1)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            delta = np.where(direction != 0, np.abs(1 / direction), np.inf)
+            t_max = np.where(direction > 0, (cell + 1 - start) * delta,
+                             np.where(direction < 0, (start - cell) * delta, np.inf))
+
+        height, width = self.collision_mask.shape
+        clear = np.ones(len(start), dtype=bool)
+        active = np.arange(len(start))
+        while active.size:
+            cell_x, cell_y = cell[active, 0], cell[active, 1]
+            inside = (cell_x >= 0) & (cell_x < width) & (cell_y >= 0) & (cell_y < height)
+            blocked = inside & self.collision_mask[np.where(inside, cell_y, 0), np.where(inside, cell_x, 0)]
+            clear[active[blocked]] = False
+
+            active = active[~blocked & (remaining[active] > 0)]
+            if not active.size:
+                break
+            axis = (t_max[active, 0] >= t_max[active, 1]).astype(np.int64)
+            cell[active, axis] += step[active, axis]
+            t_max[active, axis] += delta[active, axis]
+            remaining[active] -= 1
+        return clear.reshape(shape)
+
+    def init_probe_cache(self):
+        """Visibility cache for the fixed probe pattern, filled lazily per cell"""
+        angles = 2 * np.pi * np.arange(self.PROBE_DIRECTIONS) / self.PROBE_DIRECTIONS
+        directions = np.column_stack((np.cos(angles), np.sin(angles)))
+        self.probe_offsets = np.asarray(self.PROBE_RADII)[:, None, None] * directions[None, :, :]
+        self.probe_visibility_cache = np.zeros((self.grid_height, self.grid_width, len(self.PROBE_RADII),
+                                                self.PROBE_DIRECTIONS), dtype=bool)
+        self.probe_visibility_known = np.zeros((self.grid_height, self.grid_width), dtype=bool)
+
+    def probe_visibility(self, positions):
+        """Line of sight from each position to its probe points, shape (N, len(PROBE_RADII), PROBE_DIRECTIONS).
+
+        Walls are static, so visibility is computed once from the center of each
+        cell the first time a boid stands in it, then read back from the cache.
+        """
+        positions = np.asarray(positions, dtype=float).reshape(-1, 2)
+        grid_x, grid_y = self.cell_indices(positions)
+        inside = (grid_x >= 0) & (grid_x < self.grid_width) & (grid_y >= 0) & (grid_y < self.grid_height)
+        grid_x = np.clip(grid_x, 0, self.grid_width - 1)
+        grid_y = np.clip(grid_y, 0, self.grid_height - 1)
+
+        unknown = inside & ~self.probe_visibility_known[grid_y, grid_x]
+        if unknown.any():
+            cells = np.unique(np.column_stack((grid_x[unknown], grid_y[unknown])), axis=0)
+            centers = (cells + 0.5) * self.grid_size
+            ends = centers[:, None, None, :] + self.probe_offsets[None, :, :, :]
+            starts = np.broadcast_to(centers[:, None, None, :], ends.shape)
+            self.probe_visibility_cache[cells[:, 1], cells[:, 0]] = self.are_lines_of_sight_clear(starts, ends)
+            self.probe_visibility_known[cells[:, 1], cells[:, 0]] = True
+
+        visibility = self.probe_visibility_cache[grid_y, grid_x]
+        # Hors de la grille, pas de cache : lancer les rayons directement
+        if not inside.all():
+            outside = ~inside
+            ends = positions[outside][:, None, None, :] + self.probe_offsets[None, :, :, :]
+            starts = np.broadcast_to(positions[outside][:, None, None, :], ends.shape)
+            visibility[outside] = self.are_lines_of_sight_clear(starts, ends)
+        return visibility
+
+    def get_wall_avoidance_forces(self, positions):
+        """Vectorized get_wall_avoidance_force for an array of positions (N, 2).
+
+        The field is sampled at cell centers and bilinearly interpolated, which
+        stays close to the exact scan while costing four lookups per position.
+        """
+        positions = np.asarray(positions, dtype=float)
+        grid_x, grid_y = self.cell_indices(positions)
+        inside = (grid_x >= 0) & (grid_x < self.grid_width) & (grid_y >= 0) & (grid_y < self.grid_height)
+
+        fx = np.clip(positions[:, 0] / self.grid_size - 0.5, 0, self.grid_width - 1)
+        fy = np.clip(positions[:, 1] / self.grid_size - 0.5, 0, self.grid_height - 1)
+        x0 = np.minimum(fx.astype(np.int64), self.grid_width - 2)
+        y0 = np.minimum(fy.astype(np.int64), self.grid_height - 2)
+        tx = (fx - x0)[:, None]
+        ty = (fy - y0)[:, None]
+
+        field = self.wall_avoidance_field
+        forces = ((field[y0, x0] * (1 - tx) + field[y0, x0 + 1] * tx) * (1 - ty) +
+                  (field[y0 + 1, x0] * (1 - tx) + field[y0 + 1, x0 + 1] * tx) * ty)
+        return np.where(inside[:, None], forces, 0.0)
+
+    def compute_wall_avoidance_forces(self, positions):
+        """Exact wall avoidance at arbitrary positions, scanning the surrounding cells.
+
+        Used once at startup to fill the precomputed avoidance field.
+        """
+        positions = np.asarray(positions, dtype=float)
+        check_radius = WALL_DETECTION_DISTANCE // self.grid_size
+        offsets = np.arange(-check_radius, check_radius + 1)
+
+        grid_x, grid_y = self.cell_indices(positions)
+        check_x = grid_x[:, None, None] + offsets[None, None, :]
+        check_y = grid_y[:, None, None] + offsets[None, :, None]
+        inside = ((check_x >= 0) & (check_x < self.grid_width) &
+                  (check_y >= 0) & (check_y < self.grid_height))
+        is_wall = inside & self.wall_grid[np.where(inside, check_y, 0), np.where(inside, check_x, 0)]
+
+        diff_x = positions[:, 0, None, None] - (check_x + 0.5) * self.grid_size
+        diff_y = positions[:, 1, None, None] - (check_y + 0.5) * self.grid_size
+        distance = np.hypot(diff_x, diff_y)
+        near = is_wall & (distance > 0) & (distance < WALL_DETECTION_DISTANCE)
+
+        inv_distance = np.divide(1.0, distance, out=np.zeros_like(distance), where=near)
+        normal_x = diff_x * inv_distance
+        normal_y = diff_y * inv_distance
+        weight = np.where(near, 1 - distance / WALL_DETECTION_DISTANCE, 0.0)
+
+        avoidance = np.column_stack(((normal_x * weight).sum(axis=(1, 2)),
+                                     (normal_y * weight).sum(axis=(1, 2))))
+        wall_normal = np.column_stack((normal_x.sum(axis=(1, 2)), normal_y.sum(axis=(1, 2))))
+
+        # Favoriser le glissement le long du mur
+        return self.slide_along_walls(avoidance, wall_normal)
+
+    def slide_along_walls(self, avoidance, wall_normal):
+        """Reduce the component of the avoidance parallel to the mean wall normal"""
+        length = np.hypot(wall_normal[:, 0], wall_normal[:, 1])
+        has_wall = length > 0
+        normal = wall_normal / np.where(has_wall, length, 1.0)[:, None]
+        parallel = np.column_stack((-normal[:, 1], normal[:, 0]))
+
+        along_normal = (avoidance * normal).sum(axis=1)[:, None] * normal * 1.5
+        along_parallel = (avoidance * parallel).sum(axis=1)[:, None] * parallel * 0.5
+        return np.where(has_wall[:, None], along_normal + along_parallel, avoidance)
\ No newline at end of file
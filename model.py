@@ -0,0 +1,289 @@
+import numpy as np
+import pygame
+import random
+from config import *
+from boid import Boid
+from boid_swarm import BoidSwarm
+from spatial_hash import SpatialHash
+from map_utils import Map
+from exit_manager import ExitManager
+from fire_manager import FireManager
+from crowd_field import CrowdField
+from trajectory import TrajectoryWriter
+from profiling import profiler
+
+
+def read_only(array):
+    view = array.view()
+    view.flags.writeable = False
+    return view
+
+
+class EvacuationModel:
+    """Simulation core without any display.
+
+    Holds the map, fire, exits and boids and advances them with step(). It never
+    opens a pygame window, so it can run at CPU speed in batch jobs; the
+    SimulationRecorder subclass adds rendering and video capture on top.
+    """
+
+    def __init__(self, engine=BOID_ENGINE, num_boids=NUM_BOIDS, seed=None, crowd_field=CROWD_FIELD,
+                 flocking=FLOCKING_MODE):
+        # A seed makes the run reproducible: it seeds the random module (fire
+        # source, Boid objects) and the NumPy generator shared by fire and swarm
+        self.seed = seed
+        if seed is not None:
+            random.seed(seed)
+        self.rng = np.random.default_rng(seed)
+
+        self.map = Map()
+        self.exit_manager = ExitManager(ROOMS)
+        self.fire_manager = FireManager(ROOMS, rng=self.rng)
+        self.num_boids = num_boids
+
+        # "swarm" : tous les boids dans un BoidSwarm, "objects" : une instance Boid par occupant
+        self.engine = engine
+        self.flocking = flocking
+        self.swarm = None
+        self.boids = []
+        self.neighbor_index = SpatialHash(VISION_RADIUS)
+        if engine == "swarm":
+            self.swarm = BoidSwarm(self.map, rng=self.rng, flocking=flocking)
+            self.swarm.spawn(num_boids)
+        elif engine == "objects":
+            self.boids = self.create_boids()
+        else:
+            raise ValueError(f"Unknown boid engine: {engine}")
+
+        # Level of detail: away from the smoke and the fire, occupants are a continuous
+        # crowd instead of agents
+        self.crowd = None
+        if crowd_field:
+            self.crowd = CrowdField(self.map, rng=self.rng)
+            self.crowd.update_region(self.fire_manager)
+            self.absorb_agents()
+
+        # Optional per-step record of the boids (TrajectoryWriter)
+        self.trajectory = None
+
+        # Statistics
+        self.escaped_boids = 0
+        self.dead_boids = 0
+        self.simulation_time = 0
+        self.step_count = 0
+
+    def create_boids(self):
+        boids = []
+        boids_per_room = self.num_boids // len(ROOMS)
+        remaining_boids = self.num_boids % len(ROOMS)
+
+        for room_id, room in ROOMS.items():
+            num_room_boids = boids_per_room
+            if remaining_boids > 0:
+                num_room_boids += 1
+                remaining_boids -= 1
+
+            spawn = room["spawn_area"]
+            for _ in range(num_room_boids):
+                x = random.randint(spawn[0], spawn[0] + spawn[2])
+                y = random.randint(spawn[1], spawn[1] + spawn[3])
+                boids.append(Boid(x, y, self.map, room_id))
+
+        return boids
+
+    def update(self):
+        """Advance the model by one time step"""
+        self.simulation_time += TIME_STEP
+        self.step_count += 1
+
+        # Update fire and smoke
+        with profiler.span("fire"):
+            self.fire_manager.update()
+
+        if self.crowd is not None:
+            with profiler.span("crowd"):
+                self.update_crowd()
+
+        if self.swarm is not None:
+            with profiler.span("exits"):
+                self.exit_manager.update_swarm(self.swarm, self.simulation_time)
+                self.remove_escaped_boids()
+            with profiler.span("boids"):
+                self.swarm.update(self.exit_manager, self.fire_manager)
+        else:
+            # Update exit manager (paced by the simulation clock)
+            with profiler.span("exits"):
+                self.exit_manager.update(self.simulation_time)
+
+                # Remove escaped and dead boids
+                self.remove_escaped_boids()
+
+            # Update remaining boids
+            with profiler.span("boids"):
+                self.neighbor_index.rebuild(self.boids)
+                # Fill the probe visibility cache for every occupied cell in one batch
+                self.map.probe_visibility(self.alive_boid_positions())
+                for boid in self.boids:
+                    boid.update(self.boids, self.exit_manager, self.fire_manager, self.neighbor_index)
+
+        if self.trajectory is not None:
+            with profiler.span("trajectory"):
+                self.trajectory.record(self)
+
+    def start_trajectory(self, path, **options):
+        """Record every following step into the trajectory directory path (see TrajectoryWriter)"""
+        self.trajectory = TrajectoryWriter(path, crowd=self.crowd is not None, **options)
+        self.trajectory.record(self)
+        print(f"Recording trajectories to {path}")
+
+    def stop_trajectory(self):
+        if self.trajectory is not None:
+            self.trajectory.close()
+            print(f"Trajectories saved ({len(self.trajectory.steps)} steps, {self.trajectory.rows} rows)")
+            self.trajectory = None
+
+    def update_crowd(self):
+        crowd = self.crowd
+        # Cells reached by the smoke front switch to agents
+        crowd.update_region(self.fire_manager)
+        xs, ys, rooms, health = crowd.take_region()
+        self.add_agents(xs, ys, rooms, health)
+
+        for exit_info, count, health in crowd.update(self.fire_manager, self.exit_manager, self.simulation_time):
+            x, y = exit_info["spawn_point"]
+            self.add_agents(np.full(count, float(x)), np.full(count, float(y)), exit_info["to_room"],
+                            np.full(count, health), exit_info["direction"])
+
+        self.absorb_agents()
+        escaped, dead = crowd.take_counts()
+        self.escaped_boids = min(self.num_boids, self.escaped_boids + escaped)
+        self.dead_boids = min(self.num_boids, self.dead_boids + dead)
+
+    def add_agents(self, xs, ys, room_ids, health, direction=None):
+        """Create agents, e.g. from the crowd; direction gives them the velocity of an exit passage"""
+        n = len(xs)
+        if n == 0:
+            return
+        if self.swarm is not None:
+            self.swarm.add_boids(xs, ys, room_ids)
+            self.swarm.health[-n:] = health
+            if direction is not None:
+                self.swarm.velocities[-n:] = np.asarray(direction, dtype=float) * MAX_SPEED
+            return
+        for x, y, room_id, h in zip(xs, ys, np.broadcast_to(room_ids, n), health):
+            boid = Boid(float(x), float(y), self.map, int(room_id))
+            boid.health = float(h)
+            if direction is not None:
+                boid.velocity = pygame.Vector2(direction) * MAX_SPEED
+            self.boids.append(boid)
+
+    def absorb_agents(self):
+        """Hand the agents that left the region of interest over to the crowd field"""
+        if self.swarm is not None:
+            swarm = self.swarm
+            absorbed = swarm.is_alive & (swarm.queued_at_exit == 0)
+            absorbed[absorbed] = self.crowd.outside_agent_zone(swarm.positions[absorbed, 0],
+                                                               swarm.positions[absorbed, 1])
+            if absorbed.any():
+                positions = swarm.positions[absorbed]
+                self.crowd.add_people(positions[:, 0], positions[:, 1], swarm.current_room[absorbed],
+                                      swarm.health[absorbed])
+                swarm.compact(~absorbed)
+            return
+        kept = []
+        for boid in self.boids:
+            if (boid.is_alive and not boid.queued_at_exit
+                    and self.crowd.outside_agent_zone(boid.position.x, boid.position.y)):
+                self.crowd.add_people(boid.position.x, boid.position.y, boid.current_room, boid.health)
+            else:
+                kept.append(boid)
+        self.boids = kept
+
+    def step(self, n=1):
+        """Advance up to n time steps, stopping early once the evacuation is over.
+
+        Returns the number of steps actually simulated.
+        """
+        for done in range(n):
+            if self.is_finished():
+                return done
+            self.update()
+        return n
+
+    def is_finished(self):
+        return self.active_boid_count() == 0 or (self.escaped_boids + self.dead_boids) >= self.num_boids
+
+    def active_boid_count(self):
+        crowd = int(round(self.crowd.population())) if self.crowd is not None else 0
+        if self.swarm is not None:
+            return len(self.swarm) + crowd
+        return len(self.boids) + crowd
+
+    def alive_boid_positions(self):
+        if self.swarm is not None:
+            return self.swarm.positions[self.swarm.is_alive]
+        return np.array([(b.position.x, b.position.y) for b in self.boids if b.is_alive]).reshape(-1, 2)
+
+    def remove_escaped_boids(self):
+        if self.swarm is not None:
+            escaped, dead = self.swarm.remove_escaped()
+            self.escaped_boids = min(self.num_boids, self.escaped_boids + escaped)
+            self.dead_boids = min(self.num_boids, self.dead_boids + dead)
+            return
+
+        # Single pass: each boid is kept, counted as dead or counted as escaped
+        active_boids = []
+        for boid in self.boids:
+            if not boid.is_alive:
+                if self.dead_boids < self.num_boids:
+                    self.dead_boids += 1
+            elif boid.current_room is not None:
+                active_boids.append(boid)
+            else:
+                if self.escaped_boids < self.num_boids:
+                    self.escaped_boids += 1
+        self.boids = active_boids
+
+    def boid_state(self):
+        """Read-only arrays describing the active boids (current_room 0 means escaped)"""
+        if self.swarm is not None:
+            swarm = self.swarm
+            state = {
+                "ids": swarm.ids,
+                "positions": swarm.positions,
+                "velocities": swarm.velocities,
+                "health": swarm.health,
+                "is_alive": swarm.is_alive,
+                "boid_PR": swarm.boid_PR,
+                "current_room": swarm.current_room,
+                "queued_at_exit": swarm.queued_at_exit,
+            }
+        else:
+            state = {
+                "ids": np.array([b.boid_id for b in self.boids], dtype=np.int64),
+                "positions": np.array([(b.position.x, b.position.y) for b in self.boids]).reshape(-1, 2),
+                "velocities": np.array([(b.velocity.x, b.velocity.y) for b in self.boids]).reshape(-1, 2),
+                "health": np.array([b.health for b in self.boids], dtype=float),
+                "is_alive": np.array([b.is_alive for b in self.boids], dtype=bool),
+                "boid_PR": np.array([b.boid_PR for b in self.boids], dtype=np.int8),
+                "current_room": np.array([b.current_room or 0 for b in self.boids], dtype=np.int32),
+                "queued_at_exit": np.array([b.queued_at_exit or 0 for b in self.boids], dtype=np.int32),
+            }
+        return {name: read_only(values) for name, values in state.items()}
+
+    def smoke_state(self):
+        """Read-only view of the smoke concentration grid"""
+        return read_only(self.fire_manager.smoke_concentration)
+
+    def statistics(self):
+        alive_boids = len(self.alive_boid_positions())
+        if self.crowd is not None:
+            alive_boids += int(round(self.crowd.population()))
+        return {
+            "time": self.simulation_time,
+            "steps": self.step_count,
+            "active": alive_boids,
+            "escaped": self.escaped_boids,
+            "dead": self.dead_boids,
+            "survival_rate": (alive_boids + self.escaped_boids) / self.num_boids * 100,
+        }
@@ -0,0 +1,122 @@
+import csv
+import json
+import time
+from collections import deque
+from contextlib import nullcontext
+
+# Contexte partagé renvoyé quand le profilage est désactivé
+NULL_SPAN = nullcontext()
+
+
+class Span:
+    def __init__(self, profiler, name):
+        self.profiler = profiler
+        self.name = name
+        self.start = 0.0
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        spans = self.profiler.spans
+        spans[self.name] = spans.get(self.name, 0.0) + time.perf_counter() - self.start
+        return False
+
+
+class Profiler:
+    """Durées par phase et compteurs, regroupés par image.
+
+    Désactivé (par défaut), span() renvoie un contexte vide partagé et count()
+    ne fait rien, si bien que l'instrumentation laissée dans le code ne coûte
+    presque rien. Activé, chaque span ajoute sa durée au total de l'image en
+    cours ; end_frame() enregistre l'image et remet les totaux à zéro.
+    """
+
+    def __init__(self, history=60):
+        self.enabled = False
+        self.spans = {}
+        self.counters = {}
+        self.frames = []
+        self.recent = deque(maxlen=history)
+        self.named_spans = {}
+        self.frame_start = None
+
+    def enable(self):
+        self.enabled = True
+        self.reset()
+
+    def reset(self):
+        """Oublie les images enregistrées et repart d'une image vide"""
+        self.spans = {}
+        self.counters = {}
+        self.frames = []
+        self.recent.clear()
+        self.frame_start = time.perf_counter()
+
+    def span(self, name):
+        if not self.enabled:
+            return NULL_SPAN
+        span = self.named_spans.get(name)
+        if span is None:
+            span = self.named_spans[name] = Span(self, name)
+        return span
+
+    def count(self, name, n=1):
+        if self.enabled:
+            self.counters[name] = self.counters.get(name, 0) + int(n)
+
+    def end_frame(self):
+        if not self.enabled:
+            return
+        now = time.perf_counter()
+        record = {"frame": len(self.frames), "frame_ms": (now - self.frame_start) * 1000}
+        for name, seconds in self.spans.items():
+            record[name + "_ms"] = seconds * 1000
+        record.update(self.counters)
+        self.frames.append(record)
+        self.recent.append(record)
+        self.spans = {}
+        self.counters = {}
+        self.frame_start = now
+
+    def averages(self):
+        """Moyenne de chaque colonne sur les dernières images"""
+        totals = {}
+        for record in self.recent:
+            for name, value in record.items():
+                if name != "frame":
+                    totals[name] = totals.get(name, 0) + value
+        return {name: value / len(self.recent) for name, value in totals.items()}
+
+    def export(self, path):
+        """Écrit les images enregistrées en JSON ou, si path finit par .csv, en CSV"""
+        columns = ["frame", "frame_ms"]
+        for record in self.frames:
+            columns += [name for name in record if name not in columns]
+
+        if path.endswith(".csv"):
+            with open(path, "w", newline="") as f:
+                writer = csv.DictWriter(f, fieldnames=columns, restval=0)
+                writer.writeheader()
+                writer.writerows(self.frames)
+        else:
+            with open(path, "w") as f:
+                json.dump({"columns": columns, "frames": self.frames}, f)
+        print(f"Profile of {len(self.frames)} frames saved as {path}")
+
+    def draw_overlay(self, screen, position, size=24, color=(255, 255, 120)):
+        """Moyennes des dernières images, une ligne par span ou compteur"""
+        from text_cache import text_cache
+
+        x, y = position
+        for name, value in self.averages().items():
+            if name.endswith("_ms"):
+                text = f"{name[:-3]}: {value:.2f} ms"
+            else:
+                text = f"{name}: {value:.0f}"
+            text_cache.draw(screen, text, (x, y), size, color)
+            y += size - 4
+
+
+profiler = Profiler()
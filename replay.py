@@ -0,0 +1,193 @@
+import argparse
+import numpy as np
+import pygame
+from config import *
+from map_utils import Map
+from fire_manager import FireManager
+from exit_manager import ExitManager
+from crowd_field import CrowdField
+from boid_sprites import BoidSpriteAtlas
+from text_cache import text_cache
+from trajectory import TrajectoryReader
+from layouts import layout_key
+
+# Seconds skipped by the arrow keys (Shift: a single recorded step)
+SEEK_SECONDS = 5.0
+MAX_REPLAY_SPEED = 64
+PROGRESS_BAR = pygame.Rect(10, HEIGHT - 20, WIDTH - 20, 10)
+
+
+class ReplayViewer:
+    """Plays back a trajectory recorded with --trajectory.
+
+    Nothing is simulated: every frame looks up the recorded step for the
+    playback time through the step index and draws it with the same layers
+    as SimulationRecorder (cached map, smoke overlay, exit queues, sprite
+    atlas). Only the step index is read when opening; boid rows and smoke
+    frames are read from the memory-mapped files as they are shown.
+    """
+
+    def __init__(self, path, speed=1.0, start_time=None):
+        self.trajectory = TrajectoryReader(path)
+        if len(self.trajectory) == 0:
+            raise ValueError(f"No complete step recorded in {path}")
+        meta = self.trajectory.meta
+        # Same content hash as checkpoints: the walls drawn must be the recorded ones
+        if meta["layout"] != layout_key(WALLS, ROOMS):
+            raise ValueError(f"Trajectory {path} was recorded with a different building layout")
+
+        pygame.init()
+        self.screen = pygame.display.set_mode((WIDTH, HEIGHT))
+        pygame.display.set_caption(f"Replay - {path}")
+        self.clock = pygame.time.Clock()
+        self.font_size = 36
+
+        self.map = Map(render_only=True)
+        self.fire_manager = FireManager(ROOMS)
+        self.fire_manager.fire_source = tuple(meta["fire_source"]) if meta["fire_source"] else None
+        self.exit_manager = ExitManager(ROOMS)
+        self.sprites = BoidSpriteAtlas()
+        self.crowd = CrowdField(self.map) if "crowd" in self.trajectory.grids else None
+
+        times = self.trajectory.steps["time"]
+        self.start, self.end = float(times[0]), float(times[-1])
+        self.time = self.start if start_time is None else min(max(start_time, self.start), self.end)
+        self.speed = speed
+        self.paused = False
+
+    def seek(self, time):
+        self.time = min(max(time, self.start), self.end)
+
+    def seek_step(self, offset):
+        index = min(max(self.trajectory.index_at_time(self.time) + offset, 0), len(self.trajectory) - 1)
+        self.time = float(self.trajectory.steps["time"][index])
+
+    def handle_events(self):
+        for event in pygame.event.get():
+            if event.type == pygame.QUIT:
+                return False
+            elif event.type == pygame.KEYDOWN:
+                step = event.mod & pygame.KMOD_SHIFT
+                if event.key == pygame.K_ESCAPE:
+                    return False
+                elif event.key == pygame.K_SPACE:
+                    self.paused = not self.paused
+                    if not self.paused and self.time >= self.end:
+                        self.seek(self.start)
+                elif event.key in (pygame.K_RIGHT, pygame.K_LEFT):
+                    direction = 1 if event.key == pygame.K_RIGHT else -1
+                    if step:
+                        self.seek_step(direction)
+                    else:
+                        self.seek(self.time + direction * SEEK_SECONDS)
+                elif event.key == pygame.K_HOME:
+                    self.seek(self.start)
+                elif event.key == pygame.K_END:
+                    self.seek(self.end)
+                elif event.key in (pygame.K_PLUS, pygame.K_EQUALS, pygame.K_KP_PLUS):
+                    self.speed = min(self.speed * 2, MAX_REPLAY_SPEED)
+                elif event.key in (pygame.K_MINUS, pygame.K_KP_MINUS):
+                    self.speed = max(self.speed / 2, 1 / MAX_REPLAY_SPEED)
+            elif event.type == pygame.MOUSEBUTTONDOWN and event.button == 1:
+                if PROGRESS_BAR.inflate(0, 20).collidepoint(event.pos):
+                    fraction = (event.pos[0] - PROGRESS_BAR.left) / PROGRESS_BAR.width
+                    self.seek(self.start + fraction * (self.end - self.start))
+        return True
+
+    def draw(self):
+        trajectory = self.trajectory
+        index = trajectory.index_at_time(self.time)
+        entry = trajectory.steps[index]
+
+        self.map.draw(self.screen)
+        smoke = trajectory.grid("smoke", index)
+        if smoke is not None:
+            self.fire_manager.smoke_concentration = smoke.astype(float)
+            self.fire_manager.draw(self.screen)
+        crowd_population = 0.0
+        crowd = trajectory.grid("crowd", index) if self.crowd is not None else None
+        if crowd is not None:
+            self.crowd.density = crowd.astype(float)
+            self.crowd.draw(self.screen)
+            crowd_population = self.crowd.population()
+
+        boids = trajectory.step(index)
+        queued = np.asarray(boids["queued_at_exit"])
+        counts = np.bincount(queued[queued > 0], minlength=max(self.exit_manager.exits) + 1)
+        self.exit_manager.draw_queue_counts(self.screen, {exit_id: int(counts[exit_id])
+                                                          for exit_id in self.exit_manager.exits})
+
+        visible = np.asarray(boids["is_alive"]) & (np.asarray(boids["current_room"]) != 0)
+        self.sprites.draw(self.screen, np.asarray(boids["positions"][visible], dtype=float),
+                          np.asarray(boids["velocities"][visible], dtype=float),
+                          np.asarray(boids["health"][visible], dtype=float),
+                          np.asarray(boids["boid_PR"][visible]), queued[visible] != 0)
+
+        self.draw_statistics(entry, int(visible.sum()) + int(round(crowd_population)))
+        pygame.display.flip()
+
+    def draw_statistics(self, entry, active):
+        num_boids = self.trajectory.meta.get("num_boids")
+        stats = [
+            f"Time: {entry['time']:.1f}s / {self.end:.1f}s",
+            f"Active Boids: {active}",
+            f"Escaped Boids: {entry['escaped']}",
+            f"Dead Boids: {entry['dead']}",
+        ]
+        if num_boids:
+            stats.append(f"Survival Rate: {(active + entry['escaped']) / num_boids * 100:.1f}%")
+        stats.append(f"Replay speed: x{self.speed:g}")
+        for i, text in enumerate(stats):
+            text_cache.draw(self.screen, text, (10, 10 + i * 30), self.font_size, (255, 255, 255))
+
+        controls = [
+            "Space: Pause",
+            "ESC: Quit",
+            "Left/Right: Seek",
+            "Shift: One step",
+            "+/-: Speed",
+        ]
+        for i, text in enumerate(controls):
+            text_cache.draw(self.screen, text, (WIDTH - 200, 10 + i * 30), self.font_size, (200, 200, 200))
+        if self.paused:
+            text_cache.draw(self.screen, "PAUSED", (WIDTH//2 - 50, 10), self.font_size, (255, 200, 0))
+
+        pygame.draw.rect(self.screen, (80, 80, 80), PROGRESS_BAR)
+        if self.end > self.start:
+            done = PROGRESS_BAR.copy()
+            done.width = int(PROGRESS_BAR.width * (self.time - self.start) / (self.end - self.start))
+            pygame.draw.rect(self.screen, (200, 200, 200), done)
+
+    def run(self):
+        try:
+            while self.handle_events():
+                if not self.paused:
+                    # One displayed frame covers speed / RENDER_FPS simulated seconds
+                    self.seek(self.time + self.speed / RENDER_FPS)
+                    if self.time >= self.end:
+                        self.paused = True
+                self.draw()
+                self.clock.tick(RENDER_FPS)
+        finally:
+            pygame.quit()
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Replay a trajectory recorded with main.py --trajectory')
+    parser.add_argument('trajectory', type=str,
+                      help='Trajectory directory to play back')
+    parser.add_argument('--speed', type=float, default=1.0,
+                      help='Playback speed, 1 being real time (default: 1; +/- change it while playing)')
+    parser.add_argument('--start', type=float,
+                      help='Simulated time, in seconds, to start from')
+    parser.add_argument('--layout', type=str, metavar='FILE',
+                      help='Layout file the trajectory was recorded with (default: the building of config.py)')
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    if args.layout:
+        from layouts import use_layout
+        use_layout(args.layout)
+    ReplayViewer(args.trajectory, speed=args.speed, start_time=args.start).run()
@@ -1,74 +1,68 @@
+import time
 import pygame
-import cv2
 import numpy as np
 from config import *
-from boid import Boid
-from map_utils import Map
-from exit_manager import ExitManager
-from fire_manager import FireManager
-import random
-
-class SimulationRecorder:
-    def __init__(self, record_fps=30):
+from model import EvacuationModel
+from video_capture import AsyncVideoWriter
+from text_cache import text_cache
+from profiling import profiler
+
+class SimulationRecorder(EvacuationModel):
+    # Screen tiles used to group the regions redrawn in dirty-rectangle mode
+    DIRTY_TILE_SIZE = 50
+
+    def __init__(self, record_fps=30, engine=BOID_ENGINE, num_boids=NUM_BOIDS, seed=None,
+                 dirty_rects=DIRTY_RECT_RENDERING, frame_skip=1, drop_frames=VIDEO_DROP_FRAMES,
+                 steps_per_frame=1, fast_forward=False, crowd_field=CROWD_FIELD, flocking=FLOCKING_MODE):
+        super().__init__(engine=engine, num_boids=num_boids, seed=seed, crowd_field=crowd_field,
+                         flocking=flocking)
         pygame.init()
         self.screen = pygame.display.set_mode((WIDTH, HEIGHT))
         pygame.display.set_caption("Fire Evacuation Simulation")
-        self.map = Map()
-        self.exit_manager = ExitManager(ROOMS)
-        self.fire_manager = FireManager(ROOMS)
-        self.boids = self.create_boids()
         
         # Video recording setup
         self.is_recording = False
         self.video_writer = None
         self.record_fps = record_fps
-        
-        # Statistics
-        self.escaped_boids = 0
-        self.dead_boids = 0
-        self.simulation_time = 0
+        # Only every frame_skip-th displayed frame goes into the video
+        self.frame_skip = max(1, frame_skip)
+        self.drop_frames = drop_frames
+        self.frame_index = 0
         
         # Clock and display
         self.clock = pygame.time.Clock()
-        self.font = pygame.font.Font(None, 36)
+        self.font_size = 36
         self.paused = False
-        
-    def create_boids(self):
-        boids = []
-        boids_per_room = NUM_BOIDS // len(ROOMS)
-        remaining_boids = NUM_BOIDS % len(ROOMS)
-        
-        for room_id, room in ROOMS.items():
-            num_room_boids = boids_per_room
-            if remaining_boids > 0:
-                num_room_boids += 1
-                remaining_boids -= 1
-            
-            spawn = room["spawn_area"]
-            for _ in range(num_room_boids):
-                x = random.randint(spawn[0], spawn[0] + spawn[2])
-                y = random.randint(spawn[1], spawn[1] + spawn[3])
-                boids.append(Boid(x, y, self.map, room_id))
-                
-        return boids
+
+        # Fixed time step scheduler: steps_per_frame model steps per rendered
+        # frame, or as many as fit in the frame budget when fast_forward is on
+        self.steps_per_frame = min(max(1, steps_per_frame), MAX_STEPS_PER_FRAME)
+        self.fast_forward = fast_forward
+        self.last_steps = 0
+        self.last_draw_time = 0.0
+
+        # Dirty-rectangle mode: only redraw and push the regions that can change
+        self.dirty_rects = dirty_rects
+        self.previous_dirty_tiles = None
 
     def start_recording(self, filename='simulation_recording.mp4'):
-        fourcc = cv2.VideoWriter_fourcc(*'mp4v')
-        self.video_writer = cv2.VideoWriter(filename, fourcc, self.record_fps, (WIDTH, HEIGHT))
+        self.video_writer = AsyncVideoWriter(filename, self.record_fps, (WIDTH, HEIGHT),
+                                             queue_size=VIDEO_QUEUE_SIZE, drop_frames=self.drop_frames)
         self.is_recording = True
+        self.frame_index = 0
         print(f"Started recording to {filename}")
 
     def stop_recording(self):
         if self.is_recording:
-            self.video_writer.release()
+            self.video_writer.close()
             self.is_recording = False
-            print("Recording stopped")
+            print(f"Recording stopped ({self.video_writer.frames_written} frames written, "
+                  f"{self.video_writer.frames_dropped} dropped)")
 
     def capture_frame(self):
-        pixel_array = pygame.surfarray.array3d(self.screen)
-        pixel_array = pixel_array.swapaxes(0, 1)
-        frame = cv2.cvtColor(pixel_array, cv2.COLOR_RGB2BGR)
-        self.video_writer.write(frame)
+        if self.frame_index % self.frame_skip == 0:
+            self.video_writer.capture(self.screen)
+        self.frame_index += 1
 
     def handle_events(self):
         for event in pygame.event.get():
@@ -84,102 +78,179 @@ class SimulationRecorder:
                         self.start_recording()
                     else:
                         self.stop_recording()
+                elif event.key in (pygame.K_PLUS, pygame.K_EQUALS, pygame.K_KP_PLUS):
+                    self.steps_per_frame = min(self.steps_per_frame * 2, MAX_STEPS_PER_FRAME)
+                elif event.key in (pygame.K_MINUS, pygame.K_KP_MINUS):
+                    self.steps_per_frame = max(self.steps_per_frame // 2, 1)
+                elif event.key == pygame.K_f:
+                    self.fast_forward = not self.fast_forward
         return True
 
     def update(self):
         if not self.paused:
-            self.simulation_time += 1/60
-            
-            # Update fire and smoke
-            self.fire_manager.update()
-            
-            # Update exit manager
-            self.exit_manager.update(self.boids)
-            
-            # Remove escaped and dead boids
-            self.remove_escaped_boids()
-            
-            # Update remaining boids
-            for boid in self.boids:
-                boid.update(self.boids, self.exit_manager, self.fire_manager)
-
-    def remove_escaped_boids(self):
-        active_boids = []
-        for boid in self.boids:
-            if not boid.is_alive:
-                if boid in active_boids:
-                    active_boids.remove(boid)
-                if self.dead_boids < NUM_BOIDS:
-                    self.dead_boids += 1
-            elif boid.current_room is not None:
-                active_boids.append(boid)
-            else:
-                if self.escaped_boids < NUM_BOIDS:
-                    self.escaped_boids += 1
-        self.boids = active_boids
+            super().update()
+
+    def advance_frame(self):
+        """Run the model steps for one rendered frame; only the last state is drawn"""
+        if self.paused:
+            self.last_steps = 0
+            return
+        if not self.fast_forward:
+            self.last_steps = self.step(self.steps_per_frame)
+            return
+
+        # Fill what the fast-forward frame budget leaves after drawing, at least one step
+        deadline = time.perf_counter() + 1 / FAST_FORWARD_FPS - self.last_draw_time
+        steps = 0
+        while steps < MAX_STEPS_PER_FRAME and not self.is_finished():
+            self.update()
+            steps += 1
+            if time.perf_counter() >= deadline:
+                break
+        self.last_steps = steps
 
     def draw_statistics(self):
-        alive_boids = len([b for b in self.boids if b.is_alive])
-        total_boids = NUM_BOIDS
+        statistics = self.statistics()
         
         stats = [
-            f"Time: {self.simulation_time:.1f}s",
-            f"Active Boids: {alive_boids}",
-            f"Escaped Boids: {self.escaped_boids}",
-            f"Dead Boids: {self.dead_boids}",
-            f"Survival Rate: {((alive_boids + self.escaped_boids) / total_boids * 100):.1f}%"
+            f"Time: {statistics['time']:.1f}s",
+            f"Active Boids: {statistics['active']}",
+            f"Escaped Boids: {statistics['escaped']}",
+            f"Dead Boids: {statistics['dead']}",
+            f"Survival Rate: {statistics['survival_rate']:.1f}%",
+            f"Speed: x{self.last_steps}" + (" (fast-forward)" if self.fast_forward else "")
         ]
         
         # Display statistics
         for i, text in enumerate(stats):
-            surface = self.font.render(text, True, (255, 255, 255))
-            self.screen.blit(surface, (10, 10 + i * 30))
+            text_cache.draw(self.screen, text, (10, 10 + i * 30), self.font_size, (255, 255, 255))
         
         # Controls
         controls = [
             "Space: Pause",
             "ESC: Quit",
-            "R: Toggle Recording"
+            "R: Toggle Recording",
+            "+/-: Speed",
+            "F: Fast-forward"
         ]
         
         for i, text in enumerate(controls):
-            surface = self.font.render(text, True, (200, 200, 200))
-            self.screen.blit(surface, (WIDTH - 200, 10 + i * 30))
+            text_cache.draw(self.screen, text, (WIDTH - 200, 10 + i * 30), self.font_size, (200, 200, 200))
         
         if self.is_recording:
-            text = self.font.render("Recording...", True, (255, 0, 0))
-            self.screen.blit(text, (WIDTH - 200, HEIGHT - 40))
+            text_cache.draw(self.screen, "Recording...", (WIDTH - 200, HEIGHT - 40), self.font_size, (255, 0, 0))
         
         if self.paused:
-            text = self.font.render("PAUSED", True, (255, 200, 0))
-            self.screen.blit(text, (WIDTH//2 - 50, 10))
+            text_cache.draw(self.screen, "PAUSED", (WIDTH//2 - 50, 10), self.font_size, (255, 200, 0))
 
     def draw(self):
-        # Clear screen
-        self.screen.fill(BACKGROUND_COLOR)
+        with profiler.span("draw"):
+            if self.dirty_rects and self.previous_dirty_tiles is not None:
+                self.draw_dirty()
+            else:
+                self.draw_full()
         
-        # Draw map
+        # Capture frame if recording
+        if self.is_recording:
+            with profiler.span("capture"):
+                self.capture_frame()
+
+    def draw_full(self):
+        # Draw map (cached static layer, also clears the screen)
         self.map.draw(self.screen)
         
         # Draw fire and smoke
         self.fire_manager.draw(self.screen)
+        if self.crowd is not None:
+            self.crowd.draw(self.screen)
+        
+        self.draw_dynamic()
+        
+        # Update display
+        pygame.display.flip()
+        if self.dirty_rects:
+            self.previous_dirty_tiles = self.dirty_tiles()
+
+    def draw_dirty(self):
+        """Redraw only the tiles touched by boids, smoke, queues and the HUD this
+        frame or the previous one, and push just those tiles to the display"""
+        current_tiles = self.dirty_tiles()
+        tiles = current_tiles | self.previous_dirty_tiles
+        self.previous_dirty_tiles = current_tiles
+
+        size = self.DIRTY_TILE_SIZE
+        areas = [pygame.Rect(x * size, y * size, size, size) for y, x in zip(*np.nonzero(tiles))]
+        for area in areas:
+            self.map.draw(self.screen, area)
+        self.fire_manager.draw(self.screen, areas)
+        if self.crowd is not None:
+            self.crowd.draw(self.screen, areas)
+        
+        self.draw_dynamic()
         
+        pygame.display.update(areas)
+
+    def draw_dynamic(self):
         # Draw exit queues
         self.exit_manager.draw_queues(self.screen)
         
         # Draw boids
+        if self.swarm is not None:
+            self.swarm.draw(self.screen)
         for boid in self.boids:
             boid.draw(self.screen)
         
         # Draw statistics
         self.draw_statistics()
-        
-        # Update display
-        pygame.display.flip()
-        
-        # Capture frame if recording
-        if self.is_recording:
-            self.capture_frame()
+        if profiler.enabled:
+            profiler.draw_overlay(self.screen, PROFILE_OVERLAY_POSITION)
+
+    def dirty_tiles(self):
+        """Screen tiles that the dynamic layers draw on in the current state"""
+        size = self.DIRTY_TILE_SIZE
+        rows, cols = -(-HEIGHT // size), -(-WIDTH // size)
+        tiles = np.zeros((rows, cols), dtype=bool)
+
+        def mark(left, top, right, bottom):
+            tiles[max(0, top // size):max(0, bottom // size + 1),
+                  max(0, left // size):max(0, right // size + 1)] = True
+
+        # Boids: triangle, health bar and indicator above them
+        positions = self.alive_boid_positions()
+        if len(positions):
+            left = np.floor(positions[:, 0] - 12).astype(np.int64)
+            top = np.floor(positions[:, 1] - BOID_RADIUS - 14).astype(np.int64)
+            right = np.ceil(positions[:, 0] + 12).astype(np.int64)
+            bottom = np.ceil(positions[:, 1] + BOID_RADIUS + 2).astype(np.int64)
+            for x in (left, right):
+                for y in (top, bottom):
+                    row = np.clip(y // size, 0, rows - 1)
+                    col = np.clip(x // size, 0, cols - 1)
+                    tiles[row, col] = True
+
+        smoke = self.fire_manager.smoke_bounds()
+        if smoke is not None:
+            mark(smoke.left, smoke.top, smoke.right, smoke.bottom)
+        crowd = self.crowd.bounds() if self.crowd is not None else None
+        if crowd is not None:
+            mark(crowd.left, crowd.top, crowd.right, crowd.bottom)
+
+        # Exit queue circles and counters
+        for room in ROOMS.values():
+            for exit_info in room["exits"]:
+                x, y = exit_info["position"]
+                radius = exit_info["width"] // 2 + 2
+                mark(x - radius, y - max(radius, 25), x + radius, y + radius)
+
+        # Statistics, controls, recording and pause labels
+        mark(0, 0, 360, 200)
+        mark(WIDTH - 210, 0, WIDTH, 170)
+        mark(WIDTH - 210, HEIGHT - 50, WIDTH, HEIGHT)
+        mark(WIDTH // 2 - 60, 0, WIDTH // 2 + 100, 50)
+        if profiler.enabled:
+            x, y = PROFILE_OVERLAY_POSITION
+            mark(x, y, x + 300, y + 20 * (len(profiler.averages()) + 1))
+        return tiles
 
     def run(self, max_frames=None):
         running = True
@@ -191,9 +262,12 @@ class SimulationRecorder:
                     break
                 
                 running = self.handle_events()
-                self.update()
+                self.advance_frame()
+                draw_start = time.perf_counter()
                 self.draw()
-                self.clock.tick(60)
+                self.last_draw_time = time.perf_counter() - draw_start
+                self.clock.tick(RENDER_FPS)
+                profiler.end_frame()
                 frame_count += 1
                 
         finally:
@@ -0,0 +1,110 @@
+import numpy as np
+from config import *
+
+
+class SpatialHash:
+    """Index des boids par cellule de taille VISION_RADIUS et par salle.
+
+    Reconstruit une fois par pas de simulation, il limite la recherche des
+    voisins aux 3x3 cellules autour du boid, dans sa propre salle.
+    """
+
+    def __init__(self, cell_size=VISION_RADIUS):
+        self.cell_size = cell_size
+        self.cells = {}
+
+    def cell_of(self, position):
+        return int(position[0] // self.cell_size), int(position[1] // self.cell_size)
+
+    def rebuild(self, boids):
+        self.cells = {}
+        for boid in boids:
+            if not boid.is_alive or boid.current_room is None:
+                continue
+            cell_x, cell_y = self.cell_of(boid.position)
+            self.cells.setdefault((boid.current_room, cell_x, cell_y), []).append(boid)
+
+    def nearby(self, boid):
+        """Boids de la même salle dans les cellules voisines (candidats à filtrer par distance)"""
+        cell_x, cell_y = self.cell_of(boid.position)
+        candidates = []
+        for dy in (-1, 0, 1):
+            for dx in (-1, 0, 1):
+                candidates.extend(self.cells.get((boid.current_room, cell_x + dx, cell_y + dy), ()))
+        return candidates
+
+
+class SpatialGrid:
+    """Version tableau de SpatialHash pour BoidSwarm.
+
+    Les points sont triés par clé de cellule (salle, x, y) ; chaque requête
+    renvoie des paires (requête, candidat) générées sans boucle Python.
+    """
+
+    # Nombre maximal de paires candidates renvoyées par bloc
+    MAX_PAIRS_PER_CHUNK = 4_000_000
+
+    def __init__(self, cell_size=VISION_RADIUS):
+        self.cell_size = cell_size
+        # Une cellule de marge de chaque côté pour les voisins hors écran
+        self.grid_width = int(WIDTH // cell_size) + 3
+        self.grid_height = int(HEIGHT // cell_size) + 3
+        self.order = np.zeros(0, dtype=np.int64)
+        self.sorted_keys = np.zeros(0, dtype=np.int64)
+
+    def cell_coordinates(self, positions):
+        cell_x = np.clip(np.floor(positions[:, 0] / self.cell_size).astype(np.int64) + 1, 0, self.grid_width - 1)
+        cell_y = np.clip(np.floor(positions[:, 1] / self.cell_size).astype(np.int64) + 1, 0, self.grid_height - 1)
+        return cell_x, cell_y
+
+    def cell_keys(self, rooms, cell_x, cell_y):
+        return (rooms.astype(np.int64) * self.grid_height + cell_y) * self.grid_width + cell_x
+
+    def rebuild(self, positions, rooms):
+        cell_x, cell_y = self.cell_coordinates(positions)
+        keys = self.cell_keys(rooms, cell_x, cell_y)
+        self.order = np.argsort(keys, kind="stable")
+        self.sorted_keys = keys[self.order]
+
+    def cell_ranges(self, positions, rooms):
+        """Début et fin, dans self.order, des 9 cellules autour de chaque point (N, 9)"""
+        cell_x, cell_y = self.cell_coordinates(positions)
+        starts = []
+        ends = []
+        for dy in (-1, 0, 1):
+            for dx in (-1, 0, 1):
+                check_x = cell_x + dx
+                check_y = cell_y + dy
+                inside = ((check_x >= 0) & (check_x < self.grid_width) &
+                          (check_y >= 0) & (check_y < self.grid_height))
+                keys = self.cell_keys(rooms, check_x, check_y)
+                start = np.searchsorted(self.sorted_keys, keys, side="left")
+                end = np.searchsorted(self.sorted_keys, keys, side="right")
+                starts.append(start)
+                ends.append(np.where(inside, end, start))
+        return np.column_stack(starts), np.column_stack(ends)
+
+    def candidate_pairs(self, positions, rooms):
+        """Génère (indices des requêtes, indices des points indexés) par blocs bornés"""
+        if len(positions) == 0 or len(self.order) == 0:
+            return
+        starts, ends = self.cell_ranges(positions, rooms)
+        lengths = ends - starts
+        per_query = lengths.sum(axis=1)
+
+        # Découpage des requêtes pour borner la mémoire des paires
+        chunk_ids = np.cumsum(per_query) // self.MAX_PAIRS_PER_CHUNK
+        boundaries = np.concatenate(([0], np.flatnonzero(np.diff(chunk_ids)) + 1, [len(positions)]))
+
+        for first, last in zip(boundaries[:-1], boundaries[1:]):
+            block_lengths = lengths[first:last].ravel()
+            if block_lengths.sum() == 0:
+                continue
+            block_starts = starts[first:last].ravel()
+            queries = np.repeat(np.arange(first, last), 9)
+
+            query_index = np.repeat(queries, block_lengths)
+            run_offsets = np.cumsum(block_lengths) - block_lengths
+            within = np.arange(block_lengths.sum()) - np.repeat(run_offsets, block_lengths)
+            point_index = self.order[np.repeat(block_starts, block_lengths) + within]
+            yield query_index, point_index
@@ -0,0 +1,63 @@
+import re
+from collections import OrderedDict
+import pygame
+
+# Numbers are drawn digit by digit so a changing counter only reuses glyphs
+TEXT_PIECES = re.compile(r"\d|\D+")
+
+
+class TextCache:
+    """Rendered text surfaces shared by everything that draws text.
+
+    Fonts are created once per size and rendered strings are kept in an LRU
+    cache keyed by (text, size, color). draw() splits a string into digits and
+    the text between them, so labels such as "Time: 12.3s" are composed from a
+    handful of cached pieces instead of being rendered again every frame.
+    """
+
+    def __init__(self, max_entries=256):
+        self.max_entries = max_entries
+        self.fonts = {}
+        self.surfaces = OrderedDict()
+
+    def clear(self):
+        self.fonts.clear()
+        self.surfaces.clear()
+
+    def get_font(self, size):
+        font = self.fonts.get(size)
+        if font is None:
+            if not self.fonts:
+                # Fonts do not survive pygame.quit(): start over with fresh ones
+                pygame.register_quit(self.clear)
+            if not pygame.font.get_init():
+                pygame.font.init()
+            font = self.fonts[size] = pygame.font.Font(None, size)
+        return font
+
+    def render(self, text, size, color):
+        key = (text, size, color)
+        surface = self.surfaces.get(key)
+        if surface is not None:
+            self.surfaces.move_to_end(key)
+            return surface
+
+        surface = self.get_font(size).render(text, True, color)
+        self.surfaces[key] = surface
+        if len(self.surfaces) > self.max_entries:
+            self.surfaces.popitem(last=False)
+        return surface
+
+    def draw(self, screen, text, position, size, color):
+        """Blit text at position (top-left) and return the width drawn"""
+        x, y = position
+        sequence = []
+        for piece in TEXT_PIECES.findall(text):
+            surface = self.render(piece, size, color)
+            sequence.append((surface, (x, y)))
+            x += surface.get_width()
+        screen.blits(sequence, doreturn=False)
+        return x - position[0]
+
+
+text_cache = TextCache()
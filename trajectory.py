@@ -0,0 +1,198 @@
+import json
+import os
+import numpy as np
+from config import *
+
+# Bumped whenever the layout of the files changes
+TRAJECTORY_VERSION = 3
+
+# Per-boid columns (names of boid_state()) with their on-disk dtype and row shape
+COLUMNS = {
+    "ids": (np.int32, ()),
+    "positions": (np.float32, (2,)),
+    "velocities": (np.float32, (2,)),
+    "health": (np.float32, ()),
+    "is_alive": (np.bool_, ()),
+    "boid_PR": (np.int8, ()),
+    "current_room": (np.int16, ()),
+    "queued_at_exit": (np.int16, ()),
+}
+
+# One entry per recorded step: where its rows start in the columns, how many
+# there are, and which grid frame (smoke, crowd) was the latest at that step
+STEP_DTYPE = np.dtype([
+    ("step", np.int64),
+    ("time", np.float64),
+    ("start", np.int64),
+    ("count", np.int32),
+    ("frame", np.int32),
+    ("escaped", np.int32),
+    ("dead", np.int32),
+])
+
+
+class TrajectoryWriter:
+    """Writes the boids of every step into flat, columnar files.
+
+    Rows are gathered in preallocated chunks of chunk_rows rows per column and
+    appended to one raw file per column when a chunk is full, so memory stays
+    bounded however long the run. The smoke grid (and the crowd density, if
+    any) is kept every grid_every steps as float16 frames. steps.bin indexes
+    the rows of each step with one STEP_DTYPE record per step, appended along
+    with the rows, and meta.json describes the columns, so TrajectoryReader
+    can memory-map everything without parsing the data.
+    """
+
+    def __init__(self, path, chunk_rows=TRAJECTORY_CHUNK_ROWS, grid_every=TRAJECTORY_GRID_EVERY, crowd=False):
+        self.path = path
+        self.chunk_rows = chunk_rows
+        self.grid_every = grid_every
+        os.makedirs(path, exist_ok=True)
+
+        self.chunks = {name: np.empty((chunk_rows,) + shape, dtype=dtype)
+                       for name, (dtype, shape) in COLUMNS.items()}
+        self.files = {name: open(os.path.join(path, name + ".bin"), "wb") for name in COLUMNS}
+        self.steps_file = open(os.path.join(path, "steps.bin"), "wb")
+        self.grid_names = ["smoke"] + (["crowd"] if crowd else [])
+        self.grid_files = {name: open(os.path.join(path, name + ".bin"), "wb") for name in self.grid_names}
+
+        self.filled = 0  # rows waiting in the chunks
+        self.rows = 0  # rows recorded so far
+        self.written = 0  # rows already in the column files
+        self.frames = 0
+        self.grid_shape = None
+        self.fire_source = None
+        self.num_boids = None
+        self.layout = None
+        self.steps = []  # step records waiting for the next flush
+        self.steps_written = 0
+
+    def record(self, model):
+        """Append the current step of model"""
+        if model.step_count % self.grid_every == 0 or self.frames == 0:
+            grids = {"smoke": model.fire_manager.smoke_concentration}
+            if "crowd" in self.grid_names:
+                grids["crowd"] = model.crowd.density
+            for name, grid in grids.items():
+                self.grid_files[name].write(grid.astype(np.float16).tobytes())
+            self.grid_shape = grids["smoke"].shape
+            self.fire_source = model.fire_manager.fire_source
+            self.num_boids = model.num_boids
+            self.layout = model.map.layout_key
+            self.frames += 1
+
+        state = model.boid_state()
+        count = len(state["ids"])
+        step = (model.step_count, model.simulation_time, self.rows, count, self.frames - 1,
+                model.escaped_boids, model.dead_boids)
+
+        done = 0
+        while done < count:
+            n = min(count - done, self.chunk_rows - self.filled)
+            for name, chunk in self.chunks.items():
+                chunk[self.filled:self.filled + n] = state[name][done:done + n]
+            self.filled += n
+            done += n
+            if self.filled == self.chunk_rows:
+                self.flush()
+        self.rows += count
+        # Indexed after its rows, so a flush never writes a step with rows still pending
+        self.steps.append(step)
+        if len(self.steps) == self.chunk_rows:
+            self.flush()
+
+    def flush(self):
+        """Append the pending rows and step records to their files"""
+        for name, chunk in self.chunks.items():
+            self.files[name].write(chunk[:self.filled].tobytes())
+            self.files[name].flush()
+        self.written += self.filled
+        self.filled = 0
+        for grid_file in self.grid_files.values():
+            grid_file.flush()
+        self.steps_file.write(np.array(self.steps, dtype=STEP_DTYPE).tobytes())
+        self.steps_file.flush()
+        self.steps_written += len(self.steps)
+        self.steps = []
+        self.write_meta()
+
+    def write_meta(self):
+        meta = {
+            "version": TRAJECTORY_VERSION,
+            "time_step": TIME_STEP,
+            "size": [WIDTH, HEIGHT],
+            "rows": self.written,
+            "steps": self.steps_written,
+            "columns": {name: {"dtype": np.dtype(dtype).str, "shape": list(shape)}
+                        for name, (dtype, shape) in COLUMNS.items()},
+            "grids": self.grid_names,
+            "grid_shape": list(self.grid_shape) if self.grid_shape else None,
+            "grid_every": self.grid_every,
+            "fire_source": list(self.fire_source) if self.fire_source else None,
+            "num_boids": self.num_boids,
+            "layout": self.layout,
+        }
+        with open(os.path.join(self.path, "meta.json"), "w") as f:
+            json.dump(meta, f, indent=2)
+
+    def close(self):
+        self.flush()
+        for f in list(self.files.values()) + list(self.grid_files.values()) + [self.steps_file]:
+            f.close()
+
+
+class TrajectoryReader:
+    """Read-only, memory-mapped access to a trajectory written by TrajectoryWriter.
+
+    Nothing is loaded up front besides the step index: step(i) returns views
+    into the column files for the i-th recorded step, and the full columns are
+    available in self.columns for queries over the whole run.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        with open(os.path.join(path, "meta.json")) as f:
+            meta = json.load(f)
+        if meta.get("version") != TRAJECTORY_VERSION:
+            raise ValueError(f"Unsupported trajectory version {meta.get('version')} in {path} "
+                             f"(expected {TRAJECTORY_VERSION})")
+        self.meta = meta
+        # Only the steps counted in meta.json have all their rows flushed
+        self.steps = np.fromfile(os.path.join(path, "steps.bin"), dtype=STEP_DTYPE, count=meta["steps"])
+
+        self.columns = {}
+        for name, column in meta["columns"].items():
+            self.columns[name] = self.map_file(name, np.dtype(column["dtype"]), tuple(column["shape"]), meta["rows"])
+        self.grids = {}
+        if meta["grid_shape"]:
+            shape = tuple(meta["grid_shape"])
+            for name in meta["grids"]:
+                self.grids[name] = self.map_file(name, np.dtype(np.float16), shape)
+
+    def map_file(self, name, dtype, shape, rows=None):
+        filename = os.path.join(self.path, name + ".bin")
+        if rows is None:
+            rows = os.path.getsize(filename) // (dtype.itemsize * int(np.prod(shape, dtype=np.int64)))
+        if rows == 0:
+            return np.zeros((0,) + shape, dtype=dtype)
+        return np.memmap(filename, dtype=dtype, mode="r", shape=(rows,) + shape)
+
+    def __len__(self):
+        return len(self.steps)
+
+    def step(self, index):
+        """Columns of the index-th recorded step (views, nothing is copied)"""
+        entry = self.steps[index]
+        rows = slice(int(entry["start"]), int(entry["start"] + entry["count"]))
+        return {name: column[rows] for name, column in self.columns.items()}
+
+    def grid(self, name, index):
+        """Latest frame of grid name ("smoke" or "crowd") at the index-th recorded step"""
+        frames = self.grids.get(name)
+        if frames is None or len(frames) == 0:
+            return None
+        return frames[min(int(self.steps[index]["frame"]), len(frames) - 1)]
+
+    def index_at_time(self, time):
+        """Index of the last recorded step at or before time (seconds)"""
+        return max(0, int(np.searchsorted(self.steps["time"], time, side="right")) - 1)
@@ -0,0 +1,116 @@
+import queue
+import sys
+import threading
+import cv2
+import numpy as np
+import pygame
+
+# How often a capture() waiting for a free buffer checks that the encoder is still alive
+ENCODER_POLL_SECONDS = 0.5
+
+
+class AsyncVideoWriter:
+    """Encodes screen captures on a background thread.
+
+    capture() only copies the screen pixels into one of a fixed set of reused
+    buffers and hands it to the encoder thread, which converts it to BGR and
+    writes it with cv2.VideoWriter. The buffers double as the bounded queue:
+    when all of them are waiting to be encoded, capture() either blocks until
+    one is free (backpressure, the default) or drops the frame. If the encoder
+    thread fails, its exception is raised again by the next capture() or by
+    close() instead of leaving them waiting on buffers that never come back.
+    """
+
+    def __init__(self, filename, fps, size, queue_size=8, drop_frames=False):
+        self.size = size
+        self.drop_frames = drop_frames
+        self.frames_written = 0
+        self.frames_dropped = 0
+
+        fourcc = cv2.VideoWriter_fourcc(*'mp4v')
+        self.writer = cv2.VideoWriter(filename, fourcc, fps, size)
+
+        width, height = size
+        self.free_buffers = queue.Queue()
+        for _ in range(queue_size):
+            self.free_buffers.put(np.empty((height, width), dtype=np.uint32))
+        self.frames = queue.Queue()
+        self.channel_order = None
+        self.error = None
+
+        self.thread = threading.Thread(target=self.encode_frames, name="video-encoder", daemon=True)
+        self.thread.start()
+
+    def capture(self, surface):
+        """Queue the current content of surface; returns False if the frame was dropped"""
+        self.check_encoder()
+        if self.drop_frames:
+            try:
+                buffer = self.free_buffers.get_nowait()
+            except queue.Empty:
+                self.frames_dropped += 1
+                return False
+        else:
+            while True:
+                try:
+                    buffer = self.free_buffers.get(timeout=ENCODER_POLL_SECONDS)
+                    break
+                except queue.Empty:
+                    self.check_encoder()
+
+        if surface.get_bitsize() == 32:
+            if self.channel_order is None:
+                self.channel_order = self.bgr_byte_order(surface)
+            # The transposed pixel view is row-major, so this is a plain copy
+            pixels = pygame.surfarray.pixels2d(surface)
+            np.copyto(buffer, pixels.T)
+            del pixels
+        else:
+            # Rare non 32-bit displays: pack RGB into the same buffer layout
+            self.channel_order = (0, 1, 2) if sys.byteorder == "little" else (3, 2, 1)
+            rgb = pygame.surfarray.array3d(surface).swapaxes(0, 1).astype(np.uint32)
+            buffer[:] = rgb[..., 2] | (rgb[..., 1] << 8) | (rgb[..., 0] << 16)
+
+        self.frames.put(buffer)
+        return True
+
+    def check_encoder(self):
+        """Raise the exception the encoder thread died with, if any"""
+        if self.error is not None:
+            raise RuntimeError("Video encoder thread failed") from self.error
+        if not self.thread.is_alive():
+            raise RuntimeError("Video encoder thread is not running")
+
+    @staticmethod
+    def bgr_byte_order(surface):
+        """Byte offsets of the blue, green and red channels in a 32-bit pixel"""
+        shifts = surface.get_shifts()
+        offsets = [shift // 8 for shift in shifts[:3]]
+        if sys.byteorder == "big":
+            offsets = [3 - offset for offset in offsets]
+        red, green, blue = offsets
+        return (blue, green, red)
+
+    def encode_frames(self):
+        width, height = self.size
+        try:
+            while True:
+                buffer = self.frames.get()
+                if buffer is None:
+                    return
+                channels = buffer.view(np.uint8).reshape(height, width, 4)
+                frame = np.ascontiguousarray(channels[..., list(self.channel_order)])
+                self.writer.write(frame)
+                self.frames_written += 1
+                self.free_buffers.put(buffer)
+        except BaseException as error:
+            # Kept for the main thread, which would otherwise wait for buffers forever
+            self.error = error
+
+    def close(self):
+        """Encode the frames still queued, then release the video file"""
+        self.frames.put(None)
+        self.thread.join()
+        self.writer.release()
+        if self.error is not None:
+            raise RuntimeError("Video encoder thread failed") from self.error